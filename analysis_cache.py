@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from beatgrid import BeatGrid
+
+CACHE_VERSION = 4
+META_FILE = 'meta.json'
+CUES_FILE = 'cues.json'
+
+
+class PeakPyramidBuilder:
+    # Piramida min/max/RMS budowana w jednym przebiegu po kolejnych fragmentach sygnału mono.
+    # Poziom 0 ma base_bin próbek na punkt, każdy kolejny jest factor razy rzadszy
+    def __init__(self, samplerate, base_bin=256, factor=4, levels=5):
+        self.samplerate = samplerate
+        self.base_bin = base_bin
+        self.factor = factor
+        self.levels = levels
+        self._remainder = np.empty(0, dtype='float32')
+        self._mins = []
+        self._maxs = []
+        self._squares = []
+
+    def add(self, chunk):
+        if len(self._remainder):
+            chunk = np.concatenate([self._remainder, chunk])
+        usable = len(chunk) // self.base_bin * self.base_bin
+        if usable:
+            bins = chunk[:usable].reshape(-1, self.base_bin)
+            self._mins.append(bins.min(axis=1))
+            self._maxs.append(bins.max(axis=1))
+            self._squares.append(np.einsum('ij,ij->i', bins, bins) / self.base_bin)
+        self._remainder = np.array(chunk[usable:], dtype='float32')
+
+    def finish(self):
+        # Zwraca listę (czas trwania punktu w sekundach, tablica (n, 3) [min, max, rms]) od najdrobniejszego
+        if len(self._remainder):
+            rest = self._remainder
+            self._mins.append(rest.min(keepdims=True))
+            self._maxs.append(rest.max(keepdims=True))
+            self._squares.append(np.mean(rest * rest, keepdims=True))
+            self._remainder = np.empty(0, dtype='float32')
+        if not self._mins:
+            return []
+        mins = np.concatenate(self._mins)
+        maxs = np.concatenate(self._maxs)
+        squares = np.concatenate(self._squares)
+        peak = max(float(np.max(np.abs(mins))), float(np.max(np.abs(maxs)))) or 1.0
+
+        pyramid = []
+        bin_size = self.base_bin
+        for level in range(self.levels):
+            if level:
+                pad = (-len(mins)) % self.factor
+                if pad:
+                    mins = np.concatenate([mins, np.repeat(mins[-1:], pad)])
+                    maxs = np.concatenate([maxs, np.repeat(maxs[-1:], pad)])
+                    squares = np.concatenate([squares, np.repeat(squares[-1:], pad)])
+                mins = mins.reshape(-1, self.factor).min(axis=1)
+                maxs = maxs.reshape(-1, self.factor).max(axis=1)
+                squares = squares.reshape(-1, self.factor).mean(axis=1)
+                bin_size *= self.factor
+            peaks = np.column_stack([mins, maxs, np.sqrt(squares)]).astype('float32') / peak
+            pyramid.append((bin_size / self.samplerate, peaks))
+            if len(mins) <= 1:
+                break
+        return pyramid
+
+
+class TrackAnalysis:
+    # Wynik analizy utworu; tablice są otwierane przez np.load(mmap_mode='r'),
+    # więc wczytanie nie kopiuje danych do pamięci
+    def __init__(self, duration, peaks, beat_times, bpm=None, meta=None, key=None, energy=None, energy_profile=None):
+        self.duration = float(duration)
+        self.peaks = peaks
+        self.beat_times = beat_times
+        self.bpm = bpm
+        self.meta = meta or {}
+        # Tonacja w notacji Camelot (np. '8A'), energia w dBFS i jej przebieg w odcinkach czasu
+        self.key = key
+        self.energy = energy
+        self.energy_profile = energy_profile
+        # Hot cue: numer -> czas w sekundach; dane użytkownika, przenoszone przy ponownej analizie
+        self.cues = {}
+        self.grid = BeatGrid.from_analysis(self)
+
+    def is_valid_for(self, audio_path):
+        return self.meta.get('source') == source_signature(audio_path)
+
+    def level_for(self, seconds_per_pixel):
+        # Najrzadszy poziom, który wciąż ma co najmniej jeden punkt na piksel
+        chosen = self.peaks[0]
+        for level in self.peaks:
+            if level[0] <= seconds_per_pixel:
+                chosen = level
+        return chosen
+
+    def window(self, start_time, end_time, seconds_per_pixel):
+        # Zwraca (czasy, min, max, rms) dla punktów poziomu dopasowanego do powiększenia
+        if not self.peaks:
+            empty = np.empty(0, dtype='float32')
+            return np.empty(0), empty, empty, empty
+        bin_duration, peaks = self.level_for(seconds_per_pixel)
+        first = max(int(np.floor(start_time / bin_duration)), 0)
+        last = min(int(np.ceil(end_time / bin_duration)), len(peaks))
+        if last <= first:
+            empty = np.empty(0, dtype='float32')
+            return np.empty(0), empty, empty, empty
+        visible = np.asarray(peaks[first:last])
+        times = (np.arange(first, last) + 0.5) * bin_duration
+        return times, visible[:, 0], visible[:, 1], visible[:, 2]
+
+
+def source_signature(audio_path):
+    # Klucz cache: ścieżka, rozmiar i czas modyfikacji pliku źródłowego
+    stat = os.stat(audio_path)
+    return {'path': os.path.abspath(audio_path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def cache_path_for(audio_path, cache_dir='waveforms'):
+    digest = hashlib.sha1(os.path.abspath(audio_path).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_dir, f"{Path(audio_path).stem}-{digest}")
+
+
+def legacy_json_path(audio_path, cache_dir='waveforms'):
+    return os.path.join(cache_dir, Path(audio_path).stem + '.json')
+
+
+def save_analysis(cache_path, analysis):
+    # Zapis do unikalnego katalogu tymczasowego obok docelowego (kilka procesów może analizować
+    # ten sam utwór naraz), potem podmiana przez rename; czytelnik widzi starą albo nową analizę
+    parent = os.path.dirname(cache_path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(cache_path) + '.tmp-')
+    try:
+        _write_analysis(tmp_path, cache_path, analysis)
+        _swap_directory(tmp_path, cache_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def _write_analysis(tmp_path, cache_path, analysis):
+    for level, (_, peaks) in enumerate(analysis.peaks):
+        np.save(os.path.join(tmp_path, f'peaks_{level}.npy'), np.asarray(peaks, dtype='float32'))
+    np.save(os.path.join(tmp_path, 'beat_times.npy'), np.asarray(analysis.beat_times, dtype='float64'))
+    if analysis.energy_profile is not None:
+        np.save(os.path.join(tmp_path, 'energy.npy'), np.asarray(analysis.energy_profile, dtype='float32'))
+    cues_path = os.path.join(cache_path, CUES_FILE)
+    if analysis.cues:
+        with open(os.path.join(tmp_path, CUES_FILE), 'w') as f:
+            json.dump(analysis.cues, f)
+    elif os.path.exists(cues_path):
+        shutil.copy(cues_path, tmp_path)
+    meta = dict(analysis.meta, version=CACHE_VERSION, duration=analysis.duration, bpm=analysis.bpm,
+                key=analysis.key, energy=analysis.energy,
+                peak_levels=[bin_duration for bin_duration, _ in analysis.peaks])
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+
+def _swap_directory(tmp_path, cache_path, attempts=5):
+    # Katalogu nie da się podmienić jednym rename na niepusty, więc stary odkładamy pod unikalną nazwą
+    # i usuwamy dopiero po wstawieniu nowego. Gdy inny proces zdąży wstawić swój, powtarzamy
+    for _ in range(attempts):
+        old_path = None
+        if os.path.exists(cache_path):
+            old_path = f"{cache_path}.old-{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(cache_path, old_path)
+            except FileNotFoundError:
+                old_path = None
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            if old_path is not None:
+                shutil.rmtree(old_path, ignore_errors=True)
+            continue
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+        return
+    raise OSError(f"Nie udało się zapisać analizy w {cache_path}")
+
+
+def load_analysis(cache_path):
+    with open(os.path.join(cache_path, META_FILE), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_VERSION:
+        raise ValueError(f"Nieobsługiwana wersja cache analizy: {meta.get('version')}")
+    peaks = [(bin_duration, np.load(os.path.join(cache_path, f'peaks_{level}.npy'), mmap_mode='r'))
+             for level, bin_duration in enumerate(meta['peak_levels'])]
+    beat_times = np.load(os.path.join(cache_path, 'beat_times.npy'), mmap_mode='r')
+    energy_path = os.path.join(cache_path, 'energy.npy')
+    energy_profile = np.load(energy_path, mmap_mode='r') if os.path.exists(energy_path) else None
+    analysis = TrackAnalysis(meta['duration'], peaks, beat_times, meta.get('bpm'), meta, meta.get('key'),
+                             meta.get('energy'), energy_profile)
+    cues_path = os.path.join(cache_path, CUES_FILE)
+    if os.path.exists(cues_path):
+        with open(cues_path, 'r') as f:
+            analysis.cues = json.load(f)
+    return analysis
+
+
+def save_cues(cache_path, cues):
+    # Osobny plik w katalogu analizy, zapisywany atomowo; nie wymaga przepisywania tablic
+    if not os.path.isdir(cache_path):
+        return
+    tmp_path = os.path.join(cache_path, CUES_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(cues, f)
+    os.replace(tmp_path, os.path.join(cache_path, CUES_FILE))
+
+
+def has_analysis(cache_path):
+    return os.path.exists(os.path.join(cache_path, META_FILE))
+
+
+def load_valid_analysis(audio_path, cache_dir='waveforms'):
+    # Zwraca analizę z cache albo None, jeśli jej brak lub plik źródłowy się zmienił
+    cache_path = cache_path_for(audio_path, cache_dir)
+    if not has_analysis(cache_path):
+        return None
+    try:
+        analysis = load_analysis(cache_path)
+    except (ValueError, KeyError, OSError):
+        return None
+    return analysis if analysis.is_valid_for(audio_path) else None
+
+
+def needs_reanalysis(analysis):
+    # Wpisy przeniesione ze starego JSON (także zapisane przed wprowadzeniem znacznika) nie mają
+    # tonacji ani energii; nadają się do wyświetlenia, ale pełna analiza powinna je zastąpić
+    return analysis.meta.get('reanalyze', False) or 'key_name' not in analysis.meta
+
+
+def migrate_json(json_path, audio_path, cache_dir='waveforms'):
+    # Przenosi stary plik waveforms/*.json do formatu binarnego i usuwa JSON.
+    # Wynik jest oznaczony do ponownej analizy (needs_reanalysis)
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    times = data["times"]
+    amplitude = np.asarray(data["amplitude"], dtype='float32')
+    peak = np.max(np.abs(amplitude)) if len(amplitude) else 0
+    if peak > 0:
+        amplitude /= peak
+    beat_times = np.asarray(data["beat_times"], dtype='float64')
+    # Stary format nie zapisywał BPM; odtwarzamy je z mediany odstępów między beatami
+    bpm = 60.0 / float(np.median(np.diff(beat_times))) if len(beat_times) > 1 else None
+    duration = times[-1] if times else 0.0
+    # Stary przebieg to pojedyncze próbki, więc staje się jednym poziomem piramidy z min = max
+    peaks = [(duration / max(len(amplitude) - 1, 1), np.column_stack([amplitude, amplitude, np.abs(amplitude)]))]
+    analysis = TrackAnalysis(duration, peaks, beat_times, bpm,
+                             {'source': source_signature(audio_path), 'reanalyze': True})
+    cache_path = cache_path_for(audio_path, cache_dir)
+    save_analysis(cache_path, analysis)
+    os.remove(json_path)
+    print(f"Przeniesiono {json_path} do {cache_path}")
+    return load_analysis(cache_path)
@@ -1,64 +1,35 @@
-import sounddevice as sd
+try:
+    import sounddevice as sd
+except OSError:
+    # Brak biblioteki PortAudio (np. serwer CI): działa tylko render offline
+    sd = None
 import soundfile as sf
+import queue
 import threading
-from scipy.signal import resample, butter, lfilter
+import time
 import numpy as np
-import librosa
-import os
 
+from analysis_cache import cache_path_for, save_cues
+from beatgrid import BeatGrid
+from dsp import ThreeBandEQ, TimeStretcher
+from engine import Meter, Playhead
+from sources import PCM_EXTENSIONS, StreamingSource
+from track_manager import get_analysis
 
-def calculate_tempo(file_path):
-    try:
-        y, sr = librosa.load(file_path, sr=None)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        return float(tempo) if isinstance(tempo, np.ndarray) else float(tempo), _
-    except Exception as e:
-        print(f"Error calculating tempo for {file_path}: {e}")
-        return "N/A", "N/A"
 
-
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyquist = 0.5 * fs
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
-
-
-def butter_lowpass(cutoff, fs, order=5):
-    nyquist = 0.5 * fs
-    normal_cutoff = cutoff / nyquist
-    b, a = butter(order, normal_cutoff, btype='low')
-    return b, a
-
-
-def butter_highpass(cutoff, fs, order=5):
-    nyquist = 0.5 * fs
-    normal_cutoff = cutoff / nyquist
-    b, a = butter(order, normal_cutoff, btype='high')
-    return b, a
-
-
-def apply_filter(data, fs, band, gain):
-    if band == 'low':
-        b, a = butter_lowpass(200, fs)
-    elif band == 'mid':
-        b, a = butter_bandpass(200, 2000, fs)
-    elif band == 'high':
-        b, a = butter_highpass(2000, fs)
-    else:
-        return data
-    filtered = lfilter(b, a, data)
-    return gain * filtered
+LOOP_LENGTHS = (0.25, 0.5, 1, 2, 4, 8, 16, 32)
 
 
 class AudioPlayer:
-    def __init__(self, name):
-        self.beats = None
+    def __init__(self, name, blocksize=1024, latency=None, stream_threshold=600, pcm_cache=None):
+        self.analysis = None
         self.beat_times = None
+        self.beat_grid = BeatGrid([])
+        self.key = None
+        self.energy = None
         self.name = name
         self.file_path = None
-        self.json_path = None
+        self.waveform_path = None
         self.audio_data = None
         self.samplerate = None
         self.playing = False
@@ -66,123 +37,413 @@ class AudioPlayer:
         self.stop_event = threading.Event()
         self.current_index = 0
         self.tempo_factor = 1.0
+        # Synchronizacja fazy: deck prowadzący i bieżący mnożnik tempa z pętli regulacji miksera
+        self.sync_master = None
+        self.phase_correction = 1.0
+        self.phase_error = 0.0
+        # Obciążenie łańcucha DSP decku (ułamek budżetu bloku) i niedobory strumienia w trybie bez miksera
+        self.stretch_meter = Meter(limit=1.0)
+        self.eq_meter = Meter(limit=1.0)
+        self.underruns = 0
         self.gains = {'low': 1.0, 'mid': 1.0, 'high': 1.0}
-        self.audio_data_lr = None
-        self.sr_lr = None
+        self.eq = ThreeBandEQ()
+        self.key_lock = False
+        self.stretcher = TimeStretcher()
         self.duration = None
-
-    def butter_bandpass(self, lowcut, highcut, fs, order=5):
-        nyquist = 0.5 * fs
-        if lowcut >= highcut:
-            raise ValueError("lowcut must be less than highcut")
-        low = lowcut / nyquist
-        high = highcut / nyquist
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
-
-    def butter_lowpass(self, cutoff, fs, order=5):
-        nyquist = 0.5 * fs
-        normal_cutoff = cutoff / nyquist
-        b, a = butter(order, normal_cutoff, btype='low')
-        return b, a
-
-    def butter_highpass(self, cutoff, fs, order=5):
-        nyquist = 0.5 * fs
-        normal_cutoff = cutoff / nyquist
-        b, a = butter(order, normal_cutoff, btype='high')
-        return b, a
-
-    def apply_filter(self, data, fs, band, gain):
-        if gain == 1.0:
-            return data
-        if not isinstance(data, np.ndarray) or not np.issubdtype(data.dtype, np.floating):
-            raise ValueError(f"Dane wejściowe muszą być tablicą liczb zmiennoprzecinkowych, otrzymano: {data.dtype}")
-        if band == 'low':
-            b, a = self.butter_lowpass(200, fs)
-        elif band == 'mid':
-            b, a = self.butter_bandpass(200, 2000, fs)
-        elif band == 'high':
-            b, a = self.butter_highpass(2000, fs)
-        else:
-            return data
-        filtered = lfilter(b, a, data)
-        return (gain * filtered).astype('float32')  # Konwersja do float32
-
-    def load_track(self, file_path):
+        # Polecenia transportu (skok, pętla) z wątków GUI; wykonuje je wątek renderujący na granicy bloku
+        self._commands = queue.SimpleQueue()
+        self.loop = None
+        self._jump = None
+        self.hot_cues = {}
+        self.loop_beats = None
+        self.crossfade_ms = 4.0
+        self._fade_in = None
+        self._fade_out = None
+        self._tail = None
+        self._xfade_pos = 0
+        self._ramp = np.zeros(0)
+        self.playhead = Playhead()
+        self.blocksize = blocksize
+        self.latency = latency
+        self.mixer = None
+        self.output_samplerate = None
+        # Utwory dłuższe niż stream_threshold sekund są czytane z dysku zamiast dekodowane w całości
+        self.stream_threshold = stream_threshold
+        # Opcjonalny PcmCache: skompresowane pliki są wtedy raz dekodowane do WAV na dysku
+        self.pcm_cache = pcm_cache
+
+    def load_track(self, file_path, analyze=True, streaming=None):
         try:
-            self.tempo_factor = 1
-            self.audio_data, self.samplerate = sf.read(file_path, dtype='float32')
-            self.file_path = file_path
-            self.json_path = f'waveforms/{os.path.splitext(os.path.basename(file_path))[0]}.json'
-            self.current_index = 0
-            self.tempo, self.beats = calculate_tempo(self.file_path)
-            self.audio_data_lr, self.sr_lr = librosa.load(self.file_path, sr=None)
-            self.duration = librosa.get_duration(y=self.audio_data_lr, sr=self.sr_lr)
-            self.beat_times = librosa.frames_to_time(self.beats, sr=self.sr_lr)
+            playable = file_path
+            if self.pcm_cache is not None and not file_path.lower().endswith(PCM_EXTENSIONS):
+                playable = self.pcm_cache.get(file_path)
+            if streaming is None:
+                info = sf.info(playable)
+                streaming = self.stream_threshold is not None and info.duration > self.stream_threshold
+            if streaming:
+                audio_data = StreamingSource(playable)
+                samplerate = audio_data.samplerate
+            else:
+                audio_data, samplerate = sf.read(playable, dtype='float32', always_2d=True)
+            # Jedno dekodowanie; BPM, beaty i przebieg pochodzą z cache analizy.
+            # Z analyze=False brakująca analiza zostaje na później (set_analysis), a deck gra od razu
+            decoded = None if streaming else audio_data
+            analysis = get_analysis(file_path, decoded, samplerate, compute=analyze)
+            self._swap_track(file_path, audio_data, samplerate, analysis)
             print(f"Załadowano plik: {file_path}")
         except Exception as e:
             print(f"Błąd ładowania pliku: {e}")
 
+    def load_preloaded(self, track):
+        # Utwór zdekodowany wcześniej przez PreloadCache: tylko podmiana referencji, bez dekodowania.
+        # Analiza mogła powstać po wczytaniu do cache, więc przy jej braku sprawdzamy cache analizy jeszcze raz
+        analysis = track.analysis
+        if analysis is None:
+            analysis = track.analysis = get_analysis(track.file_path, compute=False)
+        self._swap_track(track.file_path, track.audio_data, track.samplerate, analysis)
+        print(f"Załadowano plik: {track.file_path}")
+
+    def _renderer_active(self):
+        if self.mixer is not None:
+            return self.mixer.running()
+        return self.playing
+
+    def _swap_track(self, file_path, audio_data, samplerate, analysis, timeout=1.0):
+        # Podmiana utworu zmienia bufory, których używa wątek renderujący, więc gdy ten działa,
+        # wykonuje ją on sam na granicy bloku (polecenie 'load'); wywołujący czeka najwyżej timeout
+        done = threading.Event()
+        payload = (file_path, audio_data, samplerate, analysis, done)
+        if self._renderer_active():
+            self._commands.put(('load', payload))
+            if done.wait(timeout):
+                return
+            print(f"Wątek renderujący {self.name} nie odpowiada - utwór podmieniany bezpośrednio")
+        self._install(payload)
+
+    def _install(self, payload):
+        file_path, audio_data, samplerate, analysis, done = payload
+        if done.is_set():
+            return
+        done.set()
+        if isinstance(self.audio_data, StreamingSource) and self.audio_data is not audio_data:
+            self.audio_data.close()
+        self.tempo_factor = 1
+        self.audio_data = audio_data
+        self.samplerate = samplerate
+        self.unsync()
+        self.eq.prepare(self.output_samplerate or self.samplerate, self.audio_data.shape[1])
+        self.stretcher.prepare(self.audio_data.shape[1])
+        self._prepare_transport(self.audio_data.shape[1])
+        self.file_path = file_path
+        self.waveform_path = cache_path_for(file_path)
+        self.hot_cues = {}
+        self.exit_loop()
+        self.seek(0)
+        self.set_analysis(analysis)
+
+    def set_analysis(self, analysis):
+        self.analysis = analysis
+        if analysis is not None:
+            # Cue ustawione, zanim analiza była gotowa, dopisujemy do zapisanych
+            pending = self.hot_cues
+            self.hot_cues = dict(analysis.cues)
+            if pending:
+                self.hot_cues.update(pending)
+                self._save_cues()
+        self.key = analysis.key if analysis is not None else None
+        self.energy = analysis.energy if analysis is not None else None
+        if analysis is None:
+            self.tempo = "N/A"
+            self.beat_times = np.empty(0)
+            self.beat_grid = BeatGrid([])
+            self.duration = len(self.audio_data) / self.samplerate
+        else:
+            self.tempo = analysis.bpm if analysis.bpm else "N/A"
+            self.beat_times = analysis.beat_times
+            self.beat_grid = analysis.grid
+            self.duration = analysis.duration
+
     def change_tempo_factor(self, factor):
         self.tempo_factor = float(factor)
         # print(f"Ustawiono tempo na  {self.name}: {factor*self.tempo}")
 
     def change_tempo(self, tempo):
+        if self.tempo == "N/A":
+            print(f"Brak BPM dla {self.name}, nie można ustawić tempa.")
+            return
         self.tempo_factor = float(tempo) / self.tempo
         # print(f"Ustawiono tempo na  {self.name}: {factor*self.tempo}")
 
-    def sync_to(self, other_player):
-        if other_player.tempo != "N/A":
+    def set_key_lock(self, enabled):
+        self.key_lock = bool(enabled)
+        self.stretcher.set_key_lock(self.key_lock)
+        print(f"Key lock {self.name}: {'włączony' if self.key_lock else 'wyłączony'}")
+
+    def sync_to(self, other_player, continuous=True):
+        # Dopasowanie BPM; na mikserze dodatkowo ciągłe trzymanie fazy beatu względem other_player
+        if self.beat_grid.bpm and other_player.beat_grid.bpm and self.tempo != "N/A":
+            self.tempo_factor = other_player.beat_grid.bpm * other_player.tempo_factor / self.beat_grid.bpm
+        elif other_player.tempo != "N/A":
             self.change_tempo(other_player.tempo * other_player.tempo_factor)
 
-        print(other_player.tempo * other_player.tempo_factor)
+        if continuous and self.mixer is not None and other_player.mixer is self.mixer:
+            if other_player.sync_master is self:
+                other_player.unsync()
+            self.sync_master = other_player
+            print(f"Synchronizacja fazy {self.name} -> {other_player.name}")
+
+    def unsync(self):
+        self.sync_master = None
+        self.phase_correction = 1.0
+        self.phase_error = 0.0
+
+    def follow_master(self):
+        # Wywoływane przez mikser co blok: tempo decku zsynchronizowanego idzie za bieżącym tempem mastera
+        # (BPM z dopasowanych siatek beatów); korekta fazy jest tylko niewielką poprawką na tym
+        master = self.sync_master
+        if master is not None and self.beat_grid.bpm and master.beat_grid.bpm:
+            self.tempo_factor = master.beat_grid.bpm * master.tempo_factor / self.beat_grid.bpm
+
+    def bpm(self):
+        # Bieżące BPM decku (siatka beatów, a bez niej BPM z analizy) albo None
+        base = self.beat_grid.bpm or (self.tempo if self.tempo != "N/A" else None)
+        return base * self.tempo_factor if base else None
+
+    def seek(self, index):
+        # Natychmiastowy skok; wykonany na początku następnego renderowanego bloku
+        self.current_index = int(index)
+        self._commands.put(('seek', self.current_index))
+        if not self.playing:
+            self.playhead.update(self.current_index, 0)
+
+    def jump(self, index, quantize=True):
+        # Skok na najbliższym beacie (co do próbki wewnątrz bloku, z krótkim przenikaniem);
+        # bez siatki beatów albo z quantize=False działa jak seek
+        if not quantize or not self.playing or not self.beat_grid.period:
+            self.seek(index)
+            return
+        self._commands.put(('jump', float(index)))
+
+    def apply_commands(self):
+        # Wywoływane przez wątek renderujący przed blokiem; zwraca True po natychmiastowym skoku,
+        # żeby mikser wyrzucił z bufora audio wyrenderowane wcześniej
+        flushed = False
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return flushed
+            kind, value = command
+            if kind == 'seek':
+                self.stretcher.seek(value)
+                self._jump = None
+                self._xfade_pos = len(self._fade_in) if self._fade_in is not None else 0
+                flushed = True
+            elif kind == 'jump':
+                # Punkt skoku to następny beat po pozycji renderowania; cel jest już na siatce
+                seconds = self.stretcher.position / self.samplerate
+                trigger = float(self.beat_grid.time_at(np.floor(self.beat_grid.position(seconds)) + 1))
+                self._jump = (trigger * self.samplerate, value)
+            elif kind == 'loop':
+                self.loop = value
+            elif kind == 'load':
+                self._install(value)
+                self._jump = None
+                flushed = True
+
+    def set_loop(self, beats, start=None):
+        # Pętla długości beats (1/4 .. 32) zaczynająca się na beacie najbliższym słyszanej pozycji
+        if beats not in LOOP_LENGTHS:
+            raise ValueError(f"Nieobsługiwana długość pętli: {beats}")
+        if not self.beat_grid.period:
+            print("Brak siatki beatów - pętla niedostępna.")
+            return None
+        seconds = self.playhead.position() / self.samplerate if start is None else start
+        first = float(np.round(self.beat_grid.position(seconds) / min(beats, 1)) * min(beats, 1))
+        loop_start = float(self.beat_grid.time_at(first)) * self.samplerate
+        loop_end = float(self.beat_grid.time_at(first + beats)) * self.samplerate
+        self._commands.put(('loop', (loop_start, loop_end, True)))
+        self.loop_beats = beats
+        return loop_start, loop_end
+
+    def resize_loop(self, factor):
+        # Połowa / podwojenie bieżącej pętli z zachowaniem jej początku
+        loop = self.loop
+        if loop is None:
+            return
+        beats = self.loop_beats * factor
+        if beats not in LOOP_LENGTHS:
+            return
+        start_beat = float(self.beat_grid.position(loop[0] / self.samplerate))
+        loop_end = float(self.beat_grid.time_at(start_beat + beats)) * self.samplerate
+        self._commands.put(('loop', (loop[0], loop_end, True)))
+        self.loop_beats = beats
+
+    def exit_loop(self):
+        self._commands.put(('loop', None))
+
+    def set_hot_cue(self, number, seconds=None, quantize=True):
+        # Cue na słyszanej pozycji (albo podanej), przyciągnięte do beatu; zapisywane przy analizie utworu
+        if seconds is None:
+            seconds = self.playhead.position() / self.samplerate
+        if quantize and self.beat_grid.period:
+            seconds = float(self.beat_grid.quantize(seconds))
+        self.hot_cues[str(number)] = float(seconds)
+        self._save_cues()
+        return seconds
+
+    def clear_hot_cue(self, number):
+        if self.hot_cues.pop(str(number), None) is not None:
+            self._save_cues()
+
+    def jump_to_hot_cue(self, number, quantize=True):
+        seconds = self.hot_cues.get(str(number))
+        if seconds is None:
+            return False
+        self.jump(int(round(seconds * self.samplerate)), quantize)
+        return True
+
+    def _save_cues(self):
+        if self.analysis is not None:
+            self.analysis.cues = dict(self.hot_cues)
+            save_cues(self.waveform_path, self.hot_cues)
+
+    def _prepare_transport(self, channels):
+        frames = max(int(self.crossfade_ms / 1000 * (self.output_samplerate or self.samplerate)), 1)
+        phase = np.linspace(0, np.pi / 2, frames, dtype='float32')[:, None]
+        self._fade_in = np.sin(phase)
+        self._fade_out = np.cos(phase)
+        self._tail = np.zeros((frames, channels), dtype='float32')
+        self._xfade_pos = frames
+
+    def _next_boundary(self, position):
+        # Najbliższy punkt skoku przed pozycją renderowania: koniec pętli albo zaplanowany skok (quantize)
+        boundary = None
+        loop = self.loop
+        if loop is not None:
+            start, end, armed = loop
+            if start <= position < end:
+                if armed:
+                    self.loop = (start, end, False)
+                boundary = (end, start, False)
+            elif armed and position >= end:
+                # Pętla ustawiona za późno (blok już za jej końcem): wracamy od razu, w tej samej fazie
+                self.loop = (start, end, False)
+                boundary = (position, start + (position - start) % (end - start), False)
+        jump = self._jump
+        if jump is not None:
+            trigger = max(jump[0], position)
+            if boundary is None or trigger < boundary[0]:
+                boundary = (trigger, jump[1], True)
+        return boundary
+
+    def _reserve_ramp(self, frames):
+        if len(self._ramp) < frames:
+            self._ramp = np.arange(frames, dtype='float64')
+
+    def _crossfade(self, block):
+        # Pierwsze ramki po skoku: nowy fragment narasta, ogon sprzed skoku wygasa
+        position = self._xfade_pos
+        length = len(self._fade_in)
+        if position >= length:
+            return
+        frames = min(len(block), length - position)
+        block[:frames] *= self._fade_in[position:position + frames]
+        tail = self._tail[position:position + frames]
+        tail *= self._fade_out[position:position + frames]
+        block[:frames] += tail
+        self._xfade_pos += frames
+
+    def _cross(self, boundary, position, rate):
+        # Przekroczenie granicy: przeskok z zachowaniem nadwyżki ponad punkt skoku (co do ułamka próbki)
+        trigger, target, one_shot = boundary
+        if one_shot:
+            self._jump = None
+        self._jump_to(target + position - trigger, rate)
+
+    def _jump_to(self, target, rate):
+        # Ogon: ciąg dalszy sprzed skoku, renderowany tylko na czas przenikania
+        frames = self.stretcher.process(self.audio_data, self._tail, rate)
+        self._tail[frames:] = 0
+        self.stretcher.seek(target)
+        self._xfade_pos = 0
+
+    def playback_rate(self):
+        # Tempo plus ewentualna różnica między samplerate pliku a wyjścia miksera
+        if self.output_samplerate is None:
+            return self.tempo_factor
+        return self.tempo_factor * self.phase_correction * self.samplerate / self.output_samplerate
+
+    def render_block(self, out, positions=None, equalize=True):
+        # Łańcuch DSP decku: zmiana tempa, potem EQ; zwraca liczbę wyrenderowanych ramek.
+        # Granice pętli i skoki kwantyzowane wypadają wewnątrz bloku: blok jest dzielony w tym miejscu.
+        # positions (opcjonalnie): pozycja źródła każdej ramki, także po zawinięciu pętli.
+        # equalize=False: EQ liczy wywołujący (mikser, razem dla wszystkich decków)
+        started = time.perf_counter()
+        rate = self.playback_rate()
+        total = len(out)
+        if self._tail is None or self._tail.shape[1] != out.shape[1]:
+            self._prepare_transport(out.shape[1])
+        frames = 0
+        while frames < total:
+            position = self.stretcher.position
+            boundary = self._next_boundary(position)
+            chunk = total - frames
+            if boundary is not None:
+                if boundary[0] <= position:
+                    self._cross(boundary, position, rate)
+                    continue
+                chunk = min(chunk, int(np.ceil((boundary[0] - position) / rate)))
+            rendered = self.stretcher.process(self.audio_data, out[frames:frames + chunk], rate)
+            if rendered == 0:
+                break
+            self._crossfade(out[frames:frames + rendered])
+            if positions is not None:
+                self._reserve_ramp(rendered)
+                np.multiply(self._ramp[:rendered], rate, out=positions[frames:frames + rendered])
+                positions[frames:frames + rendered] += position
+            frames += rendered
+            if boundary is not None and self.stretcher.position >= boundary[0]:
+                self._cross(boundary, self.stretcher.position, rate)
+        stretched = time.perf_counter()
+        if frames:
+            budget = frames / (self.output_samplerate or self.samplerate)
+            self.stretch_meter.record_time(stretched - started, budget)
+            if equalize:
+                self.eq.process(out[:frames], out=out[:frames])
+                self.eq_meter.record_time(time.perf_counter() - stretched, budget)
+        return frames
 
     def _play_audio(self):
         try:
-            original_audio = self.audio_data.copy()
             self.stop_event.clear()
             self.playing = True
-            blocksize = 1024
-            channels = original_audio.shape[1] if original_audio.ndim > 1 else 1
+            channels = self.audio_data.shape[1]
+            self.eq.reset()
+            self.stretcher.seek(self.current_index)
+            self.apply_commands()
 
             print(f"Rozpoczynanie odtwarzania {self.name}")
-            with sd.OutputStream(samplerate=self.samplerate, channels=channels) as stream:
-                while self.current_index < len(original_audio):
-                    if self.stop_event.is_set():
+            buffer = np.zeros((self.blocksize, channels), dtype='float32')
+            with sd.OutputStream(samplerate=self.samplerate, channels=channels, blocksize=self.blocksize,
+                                 latency=self.latency) as stream:
+                while not self.stop_event.is_set():
+                    self.apply_commands()
+                    start = self.stretcher.position
+                    rate = self.playback_rate()
+                    frames = self.render_block(buffer)
+                    if frames == 0:
                         break
-
-                    end_index = self.current_index + blocksize
-                    block = original_audio[self.current_index:end_index]
-
-                    if channels > 1:  # Stereo
-                        filtered_blocks = []
-                        for ch in range(channels):
-                            filtered = (
-                                    self.apply_filter(block[:, ch], self.samplerate, 'low', self.gains['low']) +
-                                    self.apply_filter(block[:, ch], self.samplerate, 'mid', self.gains['mid']) +
-                                    self.apply_filter(block[:, ch], self.samplerate, 'high', self.gains['high'])
-                            )
-                            resampled = resample(filtered, int(len(filtered) / self.tempo_factor))
-                            filtered_blocks.append(resampled)
-
-                        min_length = min(map(len, filtered_blocks))
-                        block = np.column_stack([b[:min_length] for b in filtered_blocks])
-
-                    else:  # Mono
-                        block = (
-                                self.apply_filter(block, self.samplerate, 'low', self.gains['low']) +
-                                self.apply_filter(block, self.samplerate, 'mid', self.gains['mid']) +
-                                self.apply_filter(block, self.samplerate, 'high', self.gains['high'])
-                        )
-                        block = resample(block, int(len(block) / self.tempo_factor))
-
-                    block = block.astype('float32')
-                    stream.write(block)
-                    self.current_index += blocksize
+                    if stream.write(buffer[:frames]):
+                        self.underruns += 1
+                    # Po powrocie z write blok czeka w buforze urządzenia przez ok. stream.latency
+                    self.playhead.update(start, rate * (self.output_samplerate or self.samplerate), stream.latency)
+                    self.current_index = int(self.stretcher.position)
         except Exception as e:
             print(f"Błąd odtwarzania: {e}")
         finally:
             self.playing = False
+            self.playhead.update(self.current_index, 0)
             print("Zakończono odtwarzanie.")
 
     def start(self):
@@ -190,16 +451,24 @@ class AudioPlayer:
             print("Nie załadowano pliku.")
             return
 
-        if not self.playing:
+        if self.playing:
+            print("Plik już jest odtwarzany.")
+        elif self.mixer is not None:
+            # Deck na szynie miksera: wątek producenta miksera sam zacznie renderować
+            self.eq.reset()
+            self.seek(self.current_index)
+            self.playing = True
+            print(f"Rozpoczynanie odtwarzania {self.name}")
+        else:
             self.thread = threading.Thread(target=self._play_audio, daemon=True)
             self.thread.start()
-        else:
-            print("Plik już jest odtwarzany.")
 
     def stop(self):
         if self.playing:
             self.stop_event.set()
-            self.current_index = 0
+            if self.mixer is not None:
+                self.playing = False
+            self.seek(0)
             print("Odtwarzanie zatrzymane i zresetowane.")
         else:
             print("Brak aktywnego odtwarzania do zatrzymania.")
@@ -207,6 +476,8 @@ class AudioPlayer:
     def pause(self):
         if self.playing:
             self.stop_event.set()
+            if self.mixer is not None:
+                self.playing = False
             print("Odtwarzanie wstrzymane.")
         else:
             print("Brak aktywnego odtwarzania do pauzowania.")
@@ -214,62 +485,47 @@ class AudioPlayer:
     def set_gain(self, band, gain):
         if band in self.gains:
             self.gains[band] = np.float32(gain)
+            self.eq.set_gain(band, gain)
             print(f"Ustawiono wzmocnienie {band} na {gain}")
         else:
             print("Nieprawidłowe pasmo.")
 
-    def dynamic_mix(self, other_player, fade_duration=30, blocksize=1024):
+    def dynamic_mix(self, other_player, fade_duration=30, lead_time=0.5):
+        # Przejście na szynie miksera: zaczyna się na najbliższej przyszłej "raz" tego utworu,
+        # a utwór wchodzący rusza od swojej "raz"; oba przechodzą przez własne tempo i EQ
         try:
-            other_player.sync_to(self)
-
-            current_time = self.current_index / self.samplerate
-            player_beats = np.array(self.beat_times)
-            other_player_beats = np.array(other_player.beat_times)
-
-            closest_beat_self = player_beats[np.argmin(np.abs(player_beats - current_time))]
-            closest_beat_other = other_player_beats[np.argmin(np.abs(other_player_beats - closest_beat_self))]
+            mixer = self.mixer
+            if mixer is None or other_player.mixer is not mixer:
+                print("Miks wymaga obu decków na wspólnym mikserze.")
+                return
+            if not self.playing:
+                print("Najpierw uruchom utwór, z którego ma nastąpić przejście.")
+                return
+            if len(self.beat_grid) == 0 or len(other_player.beat_grid) == 0:
+                print("Brak wykrytych beatów - nie można wyrównać przejścia.")
+                return
 
-            offset = closest_beat_self - closest_beat_other
-            other_player.current_index += int(offset * other_player.samplerate)
-
-            fade_samples = int(fade_duration * self.samplerate)
-            fade_out = np.linspace(1, 0, fade_samples)[:, None]
-            fade_in = np.linspace(0, 1, fade_samples)[:, None]
-
-            def crossfade():
-                with sd.OutputStream(samplerate=self.samplerate, channels=self.audio_data.shape[1]) as self_stream, \
-                        sd.OutputStream(samplerate=other_player.samplerate,
-                                        channels=other_player.audio_data.shape[1]) as other_stream:
-
-                    while self.current_index < len(self.audio_data) and other_player.current_index < len(
-                            other_player.audio_data):
-                        self_block = self.audio_data[self.current_index:self.current_index + blocksize]
-                        other_block = other_player.audio_data[
-                                      other_player.current_index:other_player.current_index + blocksize]
-
-                        min_length = min(len(self_block), len(other_block))
-                        self_block = self_block[:min_length]
-                        other_block = other_block[:min_length]
-
-                        fade_index = self.current_index - int(closest_beat_self * self.samplerate)
-                        if 0 <= fade_index < fade_samples:
-                            fade_out_block = fade_out[fade_index:fade_index + len(self_block)]
-                            fade_in_block = fade_in[fade_index:fade_index + len(other_block)]
-
-                            self_block *= fade_out_block
-                            other_block *= fade_in_block
-
-                        self_block = self_block.astype(np.float32)
-                        other_block = other_block.astype(np.float32)
-                        self_stream.write(self_block)
-                        other_stream.write(other_block)
-
-                        self.current_index += blocksize
-                        other_player.current_index += blocksize
-
-            threading.Thread(target=crossfade, daemon=True).start()
+            other_player.sync_to(self)
 
-            print("Dynamiczny crossfade uruchomiony!")
+            # Pozycja źródła na początku ostatniego bloku callbacku i jej tempo w ramkach wyjścia
+            clock, position, step, _ = mixer.channel(self).anchor
+            rate = step or self.playback_rate()
+            lead = mixer.clock - clock + lead_time * mixer.samplerate + mixer.buffer_frames
+            downbeat = self.beat_grid.next_downbeat((position + lead * rate) / self.samplerate)
+            if downbeat is None:
+                print("Za mało beatów do końca utworu, aby zaplanować przejście.")
+                return
+            start_clock = clock + int(round((downbeat * self.samplerate - position) / rate))
+
+            entry = other_player.beat_grid.next_downbeat(other_player.current_index / other_player.samplerate)
+            if entry is None:
+                entry = other_player.beat_grid.next_downbeat(0)
+            other_player.seek(int(round(entry * other_player.samplerate)))
+            mixer.schedule_transition(self, other_player, start_clock, int(fade_duration * mixer.samplerate))
+            if not other_player.playing:
+                other_player.start()
+
+            print(f"Przejście zaplanowane na {downbeat:.2f} s utworu {self.name}")
 
         except Exception as e:
             print(f"Błąd podczas dynamicznego miksowania: {e}")
@@ -0,0 +1,81 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis_cache import load_valid_analysis, needs_reanalysis
+from sources import find_audio_files
+from track_manager import analyze_file
+
+PRIORITY_DECK = 0
+PRIORITY_LIBRARY = 10
+
+
+class AnalysisWorker:
+    # Kolejka analizy w tle: utwory załadowane na deck mają pierwszeństwo przed resztą biblioteki.
+    # Właściwa analiza działa w osobnych procesach, żeby nie zabierać GIL wątkom audio i Tk.
+    def __init__(self, target_dir='waveforms', workers=1):
+        self.target_dir = target_dir
+        self.results = queue.Queue()
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(workers)
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, file_path, priority=PRIORITY_LIBRARY):
+        with self._lock:
+            if file_path in self._pending and self._pending[file_path] <= priority:
+                return
+            self._pending[file_path] = priority
+        self._queue.put((priority, next(self._counter), file_path))
+
+    def submit_folder(self, folder_path, priority=PRIORITY_LIBRARY, recursive=False):
+        for file_path in find_audio_files(folder_path, recursive):
+            self.submit(file_path, priority)
+
+    def _run(self):
+        while True:
+            priority, _, file_path = self._queue.get()
+            if file_path is None:
+                break
+            with self._lock:
+                # Wpis nieaktualny: plik został ponownie zgłoszony z wyższym priorytetem
+                if self._pending.get(file_path) != priority:
+                    continue
+                del self._pending[file_path]
+            analysis = load_valid_analysis(file_path, self.target_dir)
+            if analysis is not None and not needs_reanalysis(analysis):
+                self.results.put((file_path, None))
+                continue
+            self._slots.acquire()
+            try:
+                future = self._pool.submit(analyze_file, file_path, self.target_dir)
+            except Exception as e:
+                self._slots.release()
+                self.results.put((file_path, e))
+                continue
+            future.add_done_callback(lambda f, path=file_path: self._finished(path, f))
+
+    def _finished(self, file_path, future):
+        self._slots.release()
+        self.results.put((file_path, None if future.cancelled() else future.exception()))
+
+    def poll(self):
+        # Wywoływane z wątku Tk (root.after); zwraca listę (ścieżka, analiza, błąd)
+        ready = []
+        while True:
+            try:
+                file_path, error = self.results.get_nowait()
+            except queue.Empty:
+                return ready
+            analysis = None if error else load_valid_analysis(file_path, self.target_dir)
+            ready.append((file_path, analysis, error))
+
+    def stop(self):
+        self._queue.put((-1, -1, None))
+        self._pool.shutdown(wait=False, cancel_futures=True)
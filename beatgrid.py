@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class BeatGrid:
+    # Posortowana siatka beatów utworu (sekundy, float64) z indeksami taktów i dopasowanym
+    # modelem stałego tempa time = offset + period * index. Wszystkie zapytania to searchsorted
+    # na tablicy czasów, więc działają w O(log n) i przyjmują też tablice.
+    def __init__(self, beat_times, beats_per_bar=4, downbeat=0):
+        self.times = np.sort(np.asarray(beat_times, dtype='float64'))
+        self.beats_per_bar = beats_per_bar
+        # Indeks pierwszego beatu, który jest "raz" taktu (0 .. beats_per_bar - 1)
+        self.downbeat = downbeat % beats_per_bar
+        self.period, self.offset = self._fit()
+
+    def _fit(self):
+        # Dopasowanie metodą najmniejszych kwadratów; przy mniej niż dwóch beatach model jest pusty
+        if len(self.times) < 2:
+            return None, float(self.times[0]) if len(self.times) else 0.0
+        period, offset = np.polyfit(np.arange(len(self.times)), self.times, 1)
+        return float(period), float(offset)
+
+    @classmethod
+    def from_analysis(cls, analysis, beats_per_bar=4):
+        # "Raz" taktu zgadujemy z obwiedni RMS: wybieramy fazę, której beaty są średnio najgłośniejsze
+        grid = cls(analysis.beat_times, beats_per_bar)
+        if len(grid.times) >= 2 * beats_per_bar and analysis.peaks:
+            bin_duration, peaks = analysis.peaks[0]
+            bins = np.minimum((grid.times / bin_duration).astype(np.int64), len(peaks) - 1)
+            strength = np.asarray(peaks[:, 2])[bins]
+            usable = len(strength) // beats_per_bar * beats_per_bar
+            grid.downbeat = int(np.argmax(strength[:usable].reshape(-1, beats_per_bar).mean(axis=0)))
+        return grid
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def bpm(self):
+        return 60.0 / self.period if self.period else None
+
+    @property
+    def downbeats(self):
+        return self.times[self.downbeat::self.beats_per_bar]
+
+    def is_downbeat(self, index):
+        return (np.asarray(index) - self.downbeat) % self.beats_per_bar == 0
+
+    def nearest(self, seconds):
+        # Indeks najbliższego beatu (lub tablica indeksów); -1, gdy siatka jest pusta
+        if not len(self.times):
+            return np.full(np.shape(seconds), -1, dtype=np.int64) if np.ndim(seconds) else -1
+        index = np.clip(np.searchsorted(self.times, seconds), 1, max(len(self.times) - 1, 1))
+        before = self.times[index - 1]
+        after = self.times[np.minimum(index, len(self.times) - 1)]
+        return np.where(np.abs(np.asarray(seconds) - before) <= np.abs(after - np.asarray(seconds)), index - 1, index)
+
+    def in_range(self, start, end):
+        # Widok (bez kopii) na beaty z przedziału [start, end)
+        first, last = np.searchsorted(self.times, (start, end))
+        return self.times[first:last]
+
+    def position(self, seconds):
+        # Ułamkowy indeks beatu w chwili seconds: interpolacja między wykrytymi beatami,
+        # poza zakresem siatki ekstrapolacja modelem stałego tempa
+        seconds = np.asarray(seconds, dtype='float64')
+        if self.period is None:
+            return np.zeros_like(seconds)[()]
+        index = np.searchsorted(self.times, seconds, side='right') - 1
+        inside = (index >= 0) & (index < len(self.times) - 1)
+        clipped = np.clip(index, 0, len(self.times) - 2)
+        left = self.times[clipped]
+        right = self.times[clipped + 1]
+        interpolated = clipped + (seconds - left) / (right - left)
+        below = (seconds - self.times[0]) / self.period
+        above = len(self.times) - 1 + (seconds - self.times[-1]) / self.period
+        return np.where(inside, interpolated, np.where(index < 0, below, above))[()]
+
+    def phase(self, seconds):
+        # Faza w beacie, 0 .. 1
+        return np.mod(self.position(seconds), 1.0)
+
+    def bar_phase(self, seconds):
+        # Faza w takcie, 0 .. 1, liczona od "raz"
+        return np.mod((self.position(seconds) - self.downbeat) / self.beats_per_bar, 1.0)
+
+    def time_at(self, position):
+        # Odwrotność position: czas dla ułamkowego indeksu beatu
+        position = np.asarray(position, dtype='float64')
+        if self.period is None:
+            return np.full_like(position, self.offset)[()]
+        inside = np.interp(position, np.arange(len(self.times)), self.times)
+        below = self.times[0] + position * self.period
+        above = self.times[-1] + (position - len(self.times) + 1) * self.period
+        return np.where(position < 0, below, np.where(position > len(self.times) - 1, above, inside))[()]
+
+    def next_downbeat(self, seconds):
+        # Pierwsza "raz" taktu nie wcześniej niż seconds albo None, gdy do końca siatki jej nie ma
+        index = int(np.searchsorted(self.times, seconds))
+        index += (self.downbeat - index) % self.beats_per_bar
+        return float(self.times[index]) if index < len(self.times) else None
+
+    def quantize(self, seconds, division=1.0):
+        # Najbliższa pozycja na siatce podzielonej na division części beatu (np. 0.25 = szesnastki)
+        return self.time_at(np.round(self.position(seconds) / division) * division)
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import scipy
+
+from analysis_cache import cache_path_for, load_valid_analysis, save_analysis, source_signature
+from audio_player import AudioPlayer
+from mixer import Mixer
+from track_manager import analyze_audio
+
+
+def synthetic_track(seconds, samplerate=44100, channels=2, bpm=124.0, seed=0):
+    # Stopa co beat, szum i ton; wystarczy, żeby beat tracker i filtry miały realną pracę
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * samplerate)
+    t = np.arange(frames) / samplerate
+    signal = 0.05 * rng.standard_normal(frames) + 0.1 * np.sin(2 * np.pi * 220 * t)
+    kick = np.exp(-np.arange(2048) / 300) * np.sin(2 * np.pi * 60 * np.arange(2048) / samplerate)
+    for start in (np.arange(0, seconds, 60.0 / bpm) * samplerate).astype(int):
+        end = min(start + len(kick), frames)
+        signal[start:end] += 0.8 * kick[:end - start]
+    return np.repeat(signal[:, None], channels, axis=1).astype('float32')
+
+
+def make_player(audio, samplerate, output_samplerate=None):
+    player = AudioPlayer("bench")
+    player.audio_data = audio
+    player.samplerate = samplerate
+    player.output_samplerate = output_samplerate
+    player.eq.prepare(output_samplerate or samplerate, audio.shape[1])
+    player.stretcher.prepare(audio.shape[1])
+    return player
+
+
+def set_key_lock(player, enabled):
+    # Bez AudioPlayer.set_key_lock, który wypisuje komunikat na stdout i psułby wynik JSON
+    player.key_lock = enabled
+    player.stretcher.set_key_lock(enabled)
+
+
+def summarize(times, budget):
+    times = np.asarray(times)
+    return {
+        'blocks': len(times),
+        'budget_ms': budget * 1e3,
+        'mean_ms': float(times.mean() * 1e3),
+        'median_ms': float(np.median(times) * 1e3),
+        'p99_ms': float(np.percentile(times, 99) * 1e3),
+        'max_ms': float(times.max() * 1e3),
+        'median_load': float(np.median(times) / budget),
+        'p99_load': float(np.percentile(times, 99) / budget),
+    }
+
+
+def bench_deck(blocksizes, channel_counts, tempos, seconds, samplerate=44100):
+    # Czas łańcucha decku (zmiana tempa + EQ) na blok względem budżetu czasu rzeczywistego
+    results = []
+    for channels in channel_counts:
+        audio = synthetic_track(seconds, samplerate, channels)
+        for blocksize in blocksizes:
+            for tempo, key_lock in tempos:
+                player = make_player(audio, samplerate)
+                player.tempo_factor = tempo
+                set_key_lock(player, key_lock)
+                for band, gain in (('low', 1.5), ('mid', 0.8), ('high', 1.2)):
+                    player.eq.set_gain(band, gain)
+                player.stretcher.seek(0)
+                out = np.zeros((blocksize, channels), dtype='float32')
+                times = []
+                while True:
+                    started = time.perf_counter()
+                    frames = player.render_block(out)
+                    times.append(time.perf_counter() - started)
+                    if frames < blocksize:
+                        break
+                entry = {'blocksize': blocksize, 'channels': channels, 'tempo': tempo, 'key_lock': key_lock}
+                entry.update(summarize(times[1:] or times, blocksize / samplerate))
+                results.append(entry)
+    return results
+
+
+def bench_mixer(deck_counts, blocksize, seconds, samplerate=44100, workers=(1,)):
+    # Callback miksera (suma decków, krzywe, limiter) z "zerowym" wyjściem zamiast sounddevice.
+    # Decki z aktywnym EQ, co drugi z key lock; dla każdej liczby wątków DSP raportujemy też
+    # przyrost obciążenia na każdy dodany deck i szacunkową liczbę decków mieszczących się w budżecie
+    results = []
+    audio = synthetic_track(seconds, samplerate)
+    for worker_count in workers:
+        previous = None
+        for decks in deck_counts:
+            mixer = Mixer(samplerate=samplerate, blocksize=blocksize, max_decks=max(deck_counts),
+                          workers=worker_count)
+            for i in range(decks):
+                player = make_player(audio, samplerate, samplerate)
+                player.tempo_factor = 1.0 + 0.01 * i
+                set_key_lock(player, i % 2 == 1)
+                for band, gain in (('low', 1.5), ('mid', 0.8), ('high', 1.2)):
+                    player.eq.set_gain(band, gain)
+                mixer.add_deck(player, 'A' if i % 2 == 0 else 'B')
+                player.playing = True
+            out = np.zeros((blocksize, 2), dtype='float32')
+            render_times = []
+            mix_times = []
+            for _ in range(int(seconds * samplerate / blocksize) - 2):
+                started = time.perf_counter()
+                while mixer.render_ahead():
+                    pass
+                render_times.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                mixer.mix_into(out)
+                mix_times.append(time.perf_counter() - started)
+            budget = blocksize / samplerate
+            total_load = float(np.sum(render_times) + np.sum(mix_times)) / (len(mix_times) * budget)
+            entry = {'decks': decks, 'blocksize': blocksize, 'workers': worker_count,
+                     'callback': summarize(mix_times, budget), 'total_load': total_load}
+            if previous is not None:
+                per_deck = (total_load - previous[1]) / (decks - previous[0])
+                entry['load_per_added_deck'] = per_deck
+                entry['headroom'] = 1.0 - total_load
+                entry['decks_in_budget'] = decks + entry['headroom'] / per_deck if per_deck > 0 else None
+            previous = (decks, total_load)
+            results.append(entry)
+    return results
+
+
+def bench_analysis(seconds, samplerate=44100):
+    # Pierwsze wywołanie zawiera kompilację numba w librosa, dlatego raportujemy oba przebiegi
+    mono = synthetic_track(seconds, samplerate, channels=1)[:, 0]
+    runs = []
+    for _ in range(2):
+        started = time.perf_counter()
+        analyze_audio(mono, samplerate)
+        runs.append(time.perf_counter() - started)
+    minutes = seconds / 60
+    return {'track_seconds': seconds, 'cold_s': runs[0], 'warm_s': runs[1],
+            'cold_s_per_minute': runs[0] / minutes, 'warm_s_per_minute': runs[1] / minutes}
+
+
+def bench_waveform_load(seconds, repeats=20, samplerate=44100):
+    # Zapis i odczyt (mmap) cache analizy oraz zapytanie o okno widoku
+    mono = synthetic_track(seconds, samplerate, channels=1)[:, 0]
+    analysis = analyze_audio(mono, samplerate)
+    with tempfile.TemporaryDirectory() as directory:
+        audio_path = os.path.join(directory, 'track.wav')
+        open(audio_path, 'wb').close()
+        analysis.meta['source'] = source_signature(audio_path)
+        started = time.perf_counter()
+        save_analysis(cache_path_for(audio_path, directory), analysis)
+        save_time = time.perf_counter() - started
+        load_times = []
+        window_times = []
+        for i in range(repeats):
+            started = time.perf_counter()
+            loaded = load_valid_analysis(audio_path, directory)
+            load_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            loaded.window(i, i + 10, 10 / 800)
+            window_times.append(time.perf_counter() - started)
+    return {'track_seconds': seconds, 'save_ms': save_time * 1e3,
+            'load_median_ms': float(np.median(load_times) * 1e3),
+            'window_median_ms': float(np.median(window_times) * 1e3)}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit or None, 'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'timestamp': time.time()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ścieżki DSP i analizy (bez urządzenia audio).")
+    parser.add_argument('--output', default=None, help="plik JSON z wynikami (domyślnie stdout)")
+    parser.add_argument('--quick', action='store_true', help="krótsze sygnały i mniej konfiguracji")
+    parser.add_argument('--skip-analysis', action='store_true', help="pomiń analizę librosa (najwolniejsza)")
+    args = parser.parse_args()
+
+    seconds = 5 if args.quick else 20
+    blocksizes = (256, 1024) if args.quick else (128, 256, 512, 1024, 2048)
+    tempos = ((1.0, False), (1.08, False), (1.08, True))
+    results = {'environment': environment()}
+    results['deck'] = bench_deck(blocksizes, (1, 2), tempos, seconds)
+    cpus = os.cpu_count() or 1
+    results['mixer'] = bench_mixer((1, 2, 4) if args.quick else (1, 2, 4, 6, 8), 256, seconds,
+                                   workers=sorted({1, min(cpus, 8)}))
+    if not args.skip_analysis:
+        results['analysis'] = bench_analysis(30 if args.quick else 120)
+        results['waveform_load'] = bench_waveform_load(30 if args.quick else 300)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        print(f"Zapisano wyniki do {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
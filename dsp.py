@@ -0,0 +1,327 @@
+import numpy as np
+from scipy.signal import butter, correlate, get_window, sosfilt, sosfilt_zi
+
+BANDS = ('low', 'mid', 'high')
+
+
+def design_three_band(samplerate, low_cut=200, high_cut=2000, order=5):
+    if low_cut >= high_cut:
+        raise ValueError("lowcut must be less than highcut")
+    nyquist = 0.5 * samplerate
+    return {
+        'low': butter(order, low_cut / nyquist, btype='low', output='sos'),
+        'mid': butter(order, [low_cut / nyquist, high_cut / nyquist], btype='band', output='sos'),
+        'high': butter(order, high_cut / nyquist, btype='high', output='sos'),
+    }
+
+
+class ThreeBandEQ:
+    # Współczynniki liczone raz na samplerate/zwrotnice, stan zi przenoszony między blokami.
+    def __init__(self, low_cut=200, high_cut=2000, order=5):
+        self.low_cut = low_cut
+        self.high_cut = high_cut
+        self.order = order
+        self.samplerate = None
+        self.channels = None
+        self.gains = {band: 1.0 for band in BANDS}
+        self.sos = None
+        self.zi = None
+        self._bypassed = True
+
+    def prepare(self, samplerate, channels):
+        if samplerate != self.samplerate or channels != self.channels:
+            self.samplerate = samplerate
+            self.channels = channels
+            self._design()
+
+    def set_crossover(self, low_cut, high_cut):
+        if low_cut >= high_cut:
+            raise ValueError("lowcut must be less than highcut")
+        self.low_cut = low_cut
+        self.high_cut = high_cut
+        if self.samplerate is not None:
+            self._design()
+
+    def set_gain(self, band, gain):
+        if band not in self.gains:
+            raise ValueError(f"Nieprawidłowe pasmo: {band}")
+        self.gains[band] = float(gain)
+
+    def reset(self):
+        if self.sos is not None:
+            self.zi = {band: np.zeros((sos.shape[0], 2, self.channels), dtype='float32')
+                       for band, sos in self.sos.items()}
+        self._bypassed = True
+
+    def _design(self):
+        # Współczynniki i stan w float32: sosfilt liczy wtedy w float32 i nie trzeba konwertować wyniku
+        self.sos = {band: sos.astype('float32')
+                    for band, sos in design_three_band(self.samplerate, self.low_cut, self.high_cut,
+                                                       self.order).items()}
+        self.reset()
+
+    def is_flat(self):
+        return all(gain == 1.0 for gain in self.gains.values())
+
+    def start(self, block):
+        # Start filtrów ze stanu ustalonego dla pierwszej próbki zamiast od zera
+        if not self._bypassed:
+            return
+        for band, sos in self.sos.items():
+            np.multiply(sosfilt_zi(sos)[:, :, None], block[0], out=self.zi[band], casting='unsafe')
+        self._bypassed = False
+
+    def process(self, block, out=None):
+        # block: (frames, channels) float32; wszystkie kanały jednym wywołaniem sosfilt na pasmo.
+        # Wynik trafia do out (może to być sam block), bez tworzenia nowej tablicy na sumę
+        if out is None:
+            out = np.empty_like(block)
+        if self.sos is None or self.is_flat():
+            self._bypassed = True
+            if out is not block:
+                out[:] = block
+            return out
+
+        self.start(block)
+
+        # Wszystkie pasma liczymy przed zapisem do out, bo out może być tym samym buforem co block
+        low, self.zi['low'] = sosfilt(self.sos['low'], block, axis=0, zi=self.zi['low'])
+        mid, self.zi['mid'] = sosfilt(self.sos['mid'], block, axis=0, zi=self.zi['mid'])
+        high, self.zi['high'] = sosfilt(self.sos['high'], block, axis=0, zi=self.zi['high'])
+        np.multiply(low, self.gains['low'], out=out)
+        mid *= self.gains['mid']
+        out += mid
+        high *= self.gains['high']
+        out += high
+        return out
+
+
+class EQBank:
+    # Korektory wielu decków liczone razem: kanały decków o tych samych współczynnikach (samplerate,
+    # zwrotnice) są sklejane w jedną tablicę i każde pasmo to jedno wywołanie sosfilt dla wszystkich.
+    # sosfilt zwalnia GIL na czas filtrowania, a narzut Pythona nie rośnie z liczbą decków
+    def __init__(self):
+        self._stack = np.zeros((0, 0), dtype='float32')
+
+    def _reserve(self, frames, channels):
+        if frames > self._stack.shape[0] or channels > self._stack.shape[1]:
+            self._stack = np.zeros((max(frames, self._stack.shape[0]), max(channels, self._stack.shape[1])),
+                                   dtype='float32')
+
+    def process(self, eqs, blocks):
+        # Bloki (frames, channels) przetwarzane w miejscu
+        groups = {}
+        for eq, block in zip(eqs, blocks):
+            if eq.sos is None or eq.is_flat() or not len(block):
+                eq.process(block, out=block)
+            else:
+                key = (eq.samplerate, eq.low_cut, eq.high_cut, eq.order, len(block))
+                groups.setdefault(key, []).append((eq, block))
+        for members in groups.values():
+            if len(members) == 1:
+                eq, block = members[0]
+                eq.process(block, out=block)
+            else:
+                self._process_group(members)
+
+    def _process_group(self, members):
+        frames = len(members[0][1])
+        edges = np.cumsum([0] + [block.shape[1] for _, block in members])
+        self._reserve(frames, edges[-1])
+        stack = self._stack[:frames, :edges[-1]]
+        slices = [slice(start, end) for start, end in zip(edges[:-1], edges[1:])]
+        for (eq, block), part in zip(members, slices):
+            eq.start(block)
+            stack[:, part] = block
+        sos = members[0][0].sos
+        bands = {}
+        for band in BANDS:
+            zi = np.concatenate([eq.zi[band] for eq, _ in members], axis=2)
+            bands[band], zf = sosfilt(sos[band], stack, axis=0, zi=zi)
+            for (eq, _), part in zip(members, slices):
+                eq.zi[band] = zf[:, :, part]
+        for (eq, block), part in zip(members, slices):
+            np.multiply(bands['low'][:, part], eq.gains['low'], out=block)
+            for band in ('mid', 'high'):
+                filtered = bands[band][:, part]
+                filtered *= eq.gains[band]
+                block += filtered
+
+
+def read_frames(source, start, frames):
+    # Wycinek źródła (frames, channels) dopełniony zerami poza zakresem
+    start = int(start)
+    end = start + frames
+    if start >= 0 and end <= len(source):
+        return source[start:end]
+    out = np.zeros((frames, source.shape[1]), dtype=source.dtype)
+    lo = max(start, 0)
+    hi = min(end, len(source))
+    if lo < hi:
+        out[lo - start:hi - start] = source[lo:hi]
+    return out
+
+
+class TimeStretcher:
+    # Strumieniowa zmiana tempa: varispeed (interpolacja liniowa, zmienia wysokość)
+    # albo WSOLA z key lock. Pozycja w próbkach źródła jest przenoszona między blokami.
+    def __init__(self, key_lock=False, frame_size=2048, search=256):
+        self.key_lock = key_lock
+        self.frame_size = frame_size
+        self.hop = frame_size // 2
+        self.search = search
+        self.window = get_window('hann', frame_size).astype('float32')[:, None]
+        self.channels = None
+        self.position = 0.0
+        self._ola = None
+        self._fifo = None
+        self._fifo_pos = 0
+        self._nominal = 0.0
+        self._prev = None
+        self._preroll = False
+        self._capacity = 0
+
+    def prepare(self, channels):
+        self.channels = channels
+        self._ola = np.zeros((self.frame_size, channels), dtype='float32')
+        self._fifo = np.zeros((self.hop, channels), dtype='float32')
+        self._grain = np.zeros((self.frame_size, channels), dtype='float32')
+        self._template = np.zeros(self.frame_size, dtype='float32')
+        self._region = np.zeros(self.frame_size + 2 * self.search, dtype='float32')
+        self._capacity = 0
+        self.seek(self.position)
+
+    def _reserve(self, frames):
+        # Bufory robocze varispeed; rosną tylko, gdy przyjdzie większy blok niż dotąd
+        if frames <= self._capacity:
+            return
+        self._capacity = frames
+        self._ramp = np.arange(frames, dtype='float64')
+        self._steps = np.empty(frames, dtype='float64')
+        self._floor = np.empty(frames, dtype='float64')
+        self._idx = np.empty(frames, dtype=np.int64)
+        self._next = np.empty(frames, dtype=np.int64)
+        self._frac = np.empty((frames, 1), dtype='float32')
+        self._tmp = np.empty((frames, self.channels), dtype='float32')
+
+    def set_key_lock(self, enabled):
+        self.key_lock = bool(enabled)
+        self.seek(self.position)
+
+    def seek(self, position):
+        # WSOLA po skoku zaczyna od ramki wyprzedzającej cel o jeden hop (preroll w _wsola), żeby pierwszy
+        # hop wyjścia był sumą dwóch połówek okna, a nie narastającą połówką od zera (dziura przy pętli)
+        self.position = float(position)
+        self._nominal = self.position
+        self._prev = None
+        self._preroll = True
+        self._fifo_pos = self.hop
+        if self._ola is not None:
+            self._ola.fill(0)
+
+    def process(self, source, out, rate):
+        rate = float(rate)
+        remaining = len(source) - self.position
+        if remaining <= 0 or rate <= 0:
+            return 0
+        frames = min(len(out), int(np.ceil(remaining / rate)))
+        if self.key_lock:
+            self._wsola(source, out[:frames], rate)
+        else:
+            self._varispeed(source, out[:frames], rate)
+        self.position += frames * rate
+        return frames
+
+    def _varispeed(self, source, out, rate):
+        frames = len(out)
+        start = self.position
+        if rate == 1.0 and start.is_integer():
+            out[:] = read_frames(source, start, frames)
+            return
+        self._reserve(frames)
+        steps = np.multiply(self._ramp[:frames], rate, out=self._steps[:frames])
+        steps += start
+        floor = np.floor(steps, out=self._floor[:frames])
+        frac = self._frac[:frames]
+        np.subtract(steps, floor, out=frac[:, 0])
+        base = int(floor[0])
+        idx = np.subtract(floor, base, out=self._idx[:frames], casting='unsafe')
+        following = np.add(idx, 1, out=self._next[:frames])
+        seg = read_frames(source, base, int(idx[-1]) + 2)
+        # out = a + (b - a) * frac, wszystko w buforach roboczych
+        tmp = self._tmp[:frames]
+        np.take(seg, idx, axis=0, out=out, mode='clip')
+        np.take(seg, following, axis=0, out=tmp, mode='clip')
+        tmp -= out
+        tmp *= frac
+        out += tmp
+
+    def _wsola(self, source, out, rate):
+        if self._preroll:
+            self._nominal = self.position - self.hop * rate
+            self._synthesize(source, rate)
+            self._fifo_pos = self.hop
+            self._preroll = False
+        written = 0
+        while written < len(out):
+            if self._fifo_pos >= self.hop:
+                self._synthesize(source, rate)
+            take = min(self.hop - self._fifo_pos, len(out) - written)
+            out[written:written + take] = self._fifo[self._fifo_pos:self._fifo_pos + take]
+            self._fifo_pos += take
+            written += take
+
+    def _synthesize(self, source, rate):
+        nominal = int(round(self._nominal))
+        if self._prev is None:
+            chosen = nominal
+        else:
+            # Szukamy fragmentu najlepiej pasującego do naturalnej kontynuacji poprzedniej ramki
+            template = np.sum(read_frames(source, self._prev + self.hop, self.frame_size), axis=1, out=self._template)
+            region = np.sum(read_frames(source, nominal - self.search, self.frame_size + 2 * self.search), axis=1,
+                            out=self._region)
+            corr = correlate(region, template, mode='valid', method='fft')
+            chosen = nominal - self.search + int(np.argmax(corr))
+
+        np.multiply(read_frames(source, chosen, self.frame_size), self.window, out=self._grain)
+        self._ola += self._grain
+        self._fifo[:] = self._ola[:self.hop]
+        self._ola[:-self.hop] = self._ola[self.hop:]
+        self._ola[-self.hop:] = 0
+        self._fifo_pos = 0
+        self._prev = chosen
+        self._nominal += self.hop * rate
+
+
+class Limiter:
+    # Limiter szczytowy na sumie: natychmiastowy atak, wygładzone zwolnienie,
+    # wzmocnienie interpolowane w obrębie bloku, żeby nie było trzasków
+    def __init__(self, ceiling=0.98, release=0.25):
+        self.ceiling = ceiling
+        self.release = release
+        self.gain = 1.0
+        self._ramp = None
+        self._curve = None
+
+    def process(self, block, samplerate):
+        frames = len(block)
+        if frames == 0:
+            return block
+        peak = max(float(block.max()), -float(block.min()))
+        target = min(1.0, self.ceiling / peak) if peak > 0 else 1.0
+        if target < self.gain:
+            new_gain = target
+        else:
+            coeff = np.exp(-frames / (self.release * samplerate))
+            new_gain = target + (self.gain - target) * coeff
+        if new_gain == 1.0 and self.gain == 1.0:
+            return block
+        if self._ramp is None or len(self._ramp) != frames:
+            self._ramp = np.linspace(0, 1, frames, endpoint=False, dtype='float32')[:, None] + 1.0 / frames
+            self._curve = np.empty_like(self._ramp)
+        np.multiply(self._ramp, new_gain - self.gain, out=self._curve)
+        self._curve += self.gain
+        block *= self._curve
+        self.gain = new_gain
+        np.clip(block, -self.ceiling, self.ceiling, out=block)
+        return block
@@ -0,0 +1,142 @@
+import bisect
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    # Bufor jednego producenta i jednego konsumenta. Indeksy rosną monotonicznie,
+    # każdy z nich zapisuje tylko jedna strona, więc nie potrzeba blokad.
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((capacity, channels), dtype='float32')
+        self.positions = np.zeros(capacity, dtype='float64')
+        self._ramp = np.arange(capacity, dtype='float64')
+        self.write_index = 0
+        self.read_index = 0
+        self.first_position = 0.0
+        self.last_position = 0.0
+        self.first_step = 0.0
+        self._flush_to = 0
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def flush(self):
+        # Wywoływane przez producenta; konsument przeskoczy wszystko, co zapisano wcześniej
+        self._flush_to = self.write_index
+
+    def flushing(self):
+        # Prawda, dopóki konsument nie przeskoczył jeszcze ramek sprzed ostatniego flush
+        return self._flush_to > self.read_index
+
+    def write(self, block, start_position=0.0, rate=1.0, positions=None):
+        # Pozycje źródła: liniowo od start_position z krokiem rate albo gotowa tablica positions
+        frames = min(len(block), self.free())
+        start = self.write_index % self.capacity
+        first = min(frames, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        if positions is not None:
+            self.positions[start:start + first] = positions[:first]
+        else:
+            np.multiply(self._ramp[:first], rate, out=self.positions[start:start + first])
+            self.positions[start:start + first] += start_position
+        rest = frames - first
+        if rest:
+            self.data[:rest] = block[first:frames]
+            if positions is not None:
+                self.positions[:rest] = positions[first:frames]
+            else:
+                np.multiply(self._ramp[first:frames], rate, out=self.positions[:rest])
+                self.positions[:rest] += start_position
+        self.write_index += frames
+        return frames
+
+    def read_into(self, out):
+        self.read_index = max(self.read_index, self._flush_to)
+        frames = min(len(out), self.available())
+        start = self.read_index % self.capacity
+        first = min(frames, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        rest = frames - first
+        if rest:
+            out[first:frames] = self.data[:rest]
+        if frames:
+            self.first_position = self.positions[start]
+            self.first_step = self.positions[(start + 1) % self.capacity] - self.first_position if frames > 1 else 0.0
+            self.last_position = self.positions[(self.read_index + frames - 1) % self.capacity]
+        self.read_index += frames
+        return frames
+
+
+class Playhead:
+    # Pozycja odtwarzania współdzielona między wątkiem audio a GUI. Stan to jedna krotka
+    # podmieniana w całości, więc czytelnik zawsze widzi spójny zapis bez blokad.
+    def __init__(self):
+        self._state = (0.0, 0.0, 0.0, 0.0)
+
+    def update(self, position, frames_per_second, latency=0.0, timestamp=None):
+        # position: ramka źródła na początku bufora przekazanego właśnie do urządzenia,
+        # frames_per_second: tempo przesuwania się po źródle (0, gdy deck stoi)
+        self._state = (float(position), float(frames_per_second), time.monotonic() if timestamp is None else timestamp,
+                       float(latency))
+
+    def position(self, now=None):
+        # Ramka źródła słyszana w tej chwili, z kompensacją opóźnienia wyjścia
+        position, frames_per_second, timestamp, latency = self._state
+        if frames_per_second == 0:
+            return position
+        elapsed = (time.monotonic() if now is None else now) - timestamp - latency
+        return max(position + elapsed * frames_per_second, 0.0)
+
+
+LOAD_EDGES = (0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.5, 2.0)
+LATENCY_EDGES_MS = (0.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0, 100.0, 200.0)
+FILL_EDGES = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+class Meter:
+    # Licznik wartości na blok (obciążenie jako ułamek budżetu, opóźnienie, zapełnienie bufora).
+    # Zapisuje jeden wątek; przedziały histogramu są stałe, więc pomiar w callbacku nic nie alokuje.
+    # limit: wartości powyżej liczone są jako przekroczenia (np. blok dłuższy niż budżet)
+    def __init__(self, edges=LOAD_EDGES, limit=None):
+        self.edges = list(edges)
+        self.limit = limit
+        self.histogram = [0] * len(self.edges)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+        self.count = 0
+        self.over = 0
+        self.last = 0.0
+        self.peak = 0.0
+        self.total = 0.0
+
+    def record(self, value):
+        self.histogram[max(bisect.bisect_right(self.edges, value) - 1, 0)] += 1
+        self.count += 1
+        self.last = value
+        self.total += value
+        if value > self.peak:
+            self.peak = value
+        if self.limit is not None and value > self.limit:
+            self.over += 1
+
+    def record_time(self, elapsed, budget):
+        self.record(elapsed / budget if budget > 0 else 0.0)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'last': self.last,
+            'mean': self.total / self.count if self.count else 0.0,
+            'peak': self.peak,
+            'over': self.over,
+            'histogram': {f"{edge:g}": count for edge, count in zip(self.edges, self.histogram)},
+        }
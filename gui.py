@@ -9,28 +9,58 @@ import librosa.display
 import threading
 import soundfile as sf
 
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_cache import needs_reanalysis
 from audio_player import AudioPlayer as ap
-from track_manager import load_json_data
+from background import PRIORITY_DECK, PRIORITY_LIBRARY
+from engine import Meter
+from sources import find_audio_files, is_audio_file
+from waveform_view import WaveformView
 
 
 class AudioMixerGUI:
-    def __init__(self, root, player1, player2):
+    def __init__(self, root, player1, player2, analysis_worker=None, library=None, preload=None):
         self.root = root
         self.root.title("Audio Mixer")
         self.player1 = player1
         self.player2 = player2
+        self.analysis_worker = analysis_worker
+        self.library = library
+        # Opcjonalny PreloadCache: wybór z listy nie dekoduje pliku w wątku GUI
+        self.preload = preload
+        self.preload_neighbors = 2
+        self.pending_loads = {}
+        # Bez indeksu biblioteki: nazwa wyświetlana -> pełna ścieżka
+        self.track_paths = {}
+        # listbox -> (deck, drugi deck, pole wyszukiwania, filtr BPM, ranking pasujących, ścieżki kolejnych wierszy)
+        self.listboxes = {}
+        self._lists_dirty = False
+        self._lists_refreshed = 0.0
+        self.import_pool = ThreadPoolExecutor(max_workers=1)
+        self.imported = queue.Queue()
 
         self.window_duration = 10
         self.min_window = 5
         self.max_window = 40
         self.current_start = 0
 
+        self.waveform_views = {}
+        self.frame_interval = 16
+        self.gui_meter = Meter(limit=1.0)
+        self.idle_interval = 100
         self.canvas_width = 800
         self.canvas_height = 100
         self.canvas1 = Canvas(root, width=self.canvas_width, height=self.canvas_height, bg="white")
         self.canvas1.grid(row=0, column=0, columnspan=2, sticky="nsew")
         self.canvas2 = Canvas(root, width=self.canvas_width, height=self.canvas_height, bg="white")
         self.canvas2.grid(row=1, column=0, columnspan=2, sticky="nsew")
+        for canvas in (self.canvas1, self.canvas2):
+            canvas.bind("<MouseWheel>", lambda event: self.zoom(-1 if event.delta > 0 else 1))
+            canvas.bind("<Button-4>", lambda event: self.zoom(-1))
+            canvas.bind("<Button-5>", lambda event: self.zoom(1))
 
         self.frame_player1 = ttk.LabelFrame(root, text="Odtwarzacz 1")
         self.frame_player1.grid(row=2, column=0, padx=10, pady=10)
@@ -42,31 +72,120 @@ class AudioMixerGUI:
 
         self.create_player_controls(self.frame_player2, player2, player1)
 
+        if player1.mixer is not None:
+            mixer = player1.mixer
+            self.crossfader_scale = tk.Scale(root, from_=0, to=1, orient="horizontal", length=300,
+                                             resolution=0.01, label="Crossfader",
+                                             command=lambda value: mixer.set_crossfader(value))
+            self.crossfader_scale.set(mixer.crossfader)
+            self.crossfader_scale.grid(row=3, column=0, columnspan=2)
+
+            # Miernik obciążenia: callback, DSP decków, wątek GUI; szczegóły można zrzucić do pliku
+            self.load_label = tk.Label(root, text="", anchor="w", font=("TkFixedFont", 9))
+            self.load_label.grid(row=4, column=0, sticky="w", padx=10)
+            ttk.Button(root, text="Zapisz statystyki", command=self.dump_stats).grid(row=4, column=1, sticky="e",
+                                                                                    padx=10)
+            self.root.after(250, self.update_load_meter)
+
+        if analysis_worker is not None:
+            self.root.after(100, self.poll_analysis)
+        self.root.after(100, self.poll_imports)
+        if library is not None:
+            self.import_folder('utils')
+        self.refresh_waveforms()
+
+    def poll_analysis(self):
+        for file_path, analysis, error in self.analysis_worker.poll():
+            if error is not None:
+                print(f"Błąd analizy {file_path}: {error}")
+                continue
+            if self.library is not None and analysis is not None:
+                self.library.update_analysis(file_path, analysis.bpm, analysis.duration, analysis.key,
+                                             analysis.energy, key_checked=not needs_reanalysis(analysis))
+                self._lists_dirty = True
+            for player in (self.player1, self.player2):
+                if player.file_path is not None and os.path.abspath(player.file_path) == os.path.abspath(file_path):
+                    player.set_analysis(analysis)
+                    self.update_tempo_label(player)
+        # Wyniki analizy biblioteki odświeżają listy najwyżej co 2 s
+        if self._lists_dirty and time.monotonic() - self._lists_refreshed > 2:
+            self.refresh_lists()
+        self.root.after(100, self.poll_analysis)
+
+    def import_folder(self, folder_path):
+        # Skanowanie nie blokuje GUI; z indeksem biblioteki skan jest przyrostowy i zwraca
+        # tylko nowe i zmienione pliki, które trzeba przeanalizować
+        if self.library is not None:
+            def scan():
+                added, changed, removed = self.library.scan(folder_path)
+                print(f"Skan {folder_path}: nowe {len(added)}, zmienione {len(changed)}, usunięte {len(removed)}")
+                self.imported.put(self.library.needs_analysis())
+        else:
+            def scan():
+                self.imported.put(find_audio_files(folder_path))
+        self.import_pool.submit(scan)
+
+    def poll_imports(self):
+        # Wyniki skanowania folderów trafiają do listboxów w wątku GUI
+        while True:
+            try:
+                file_paths = self.imported.get_nowait()
+            except queue.Empty:
+                break
+            for file_path in file_paths:
+                if self.library is not None:
+                    # Skan już zapisał pliki w indeksie; zostaje tylko analiza
+                    if self.analysis_worker is not None:
+                        self.analysis_worker.submit(file_path, PRIORITY_LIBRARY)
+                else:
+                    self.add_track(file_path, PRIORITY_LIBRARY, refresh=False)
+            self.refresh_lists()
+            print(f"Zaimportowano {len(file_paths)} plików")
+        self.root.after(100, self.poll_imports)
+
+    def add_track(self, file_path, priority=PRIORITY_LIBRARY, refresh=True):
+        if self.library is not None:
+            self.library.add(file_path)
+        else:
+            name = os.path.basename(file_path)
+            if self.track_paths.get(name) not in (None, file_path):
+                name = os.path.relpath(file_path)
+            self.track_paths.setdefault(name, file_path)
+        if refresh:
+            self.refresh_lists()
+        if self.analysis_worker is not None:
+            self.analysis_worker.submit(file_path, priority)
+
+    def refresh_lists(self):
+        self._lists_dirty = False
+        self._lists_refreshed = time.monotonic()
+        for listbox in self.listboxes:
+            self.fill_file_list(listbox)
+
+    def update_load_meter(self):
+        mixer = self.player1.mixer
+        self.load_label.config(text=f"{mixer.summary()} | GUI {self.gui_meter.last:.0%}")
+        # Synchronizację wyłącza też koniec przejścia w wątku miksera
+        self.update_sync_buttons()
+        self.root.after(250, self.update_load_meter)
+
+    def dump_stats(self):
+        self.player1.mixer.dump_stats(f"stats-{time.strftime('%Y%m%d-%H%M%S')}.json",
+                                      {'gui_frame_load': self.gui_meter.snapshot()})
+
     def create_player_controls(self, frame, player, other_player):
         player.track_label = tk.Label(frame, text=Path(player.file_path).stem, fg="red", wraplength=200)
         player.track_label.grid(row=2, column=0, columnspan=3, pady=5)
 
-        if player.name == 'player1':
-            self.toggle_animation = self.animate(self.canvas1, load_json_data(player.json_path), self.window_duration,
-                                                 self.canvas_width, self.canvas_height, 0.05, 50)
-
-            btn_start = ttk.Button(frame, text="Start", command=self.toggle_start(self.toggle_animation, player))
-            btn_start.grid(row=3, column=0, padx=5, pady=5)
-
-            btn_stop = ttk.Button(frame, text="Stop", command=self.toggle_stop(self.toggle_animation, player))
-            btn_stop.grid(row=3, column=1, padx=5, pady=5)
-        else:
-            self.toggle_animation2 = self.animate(self.canvas2, load_json_data(player.json_path), self.window_duration,
-                                                  self.canvas_width, self.canvas_height, 0.05, 50)
-
-            btn_start = ttk.Button(frame, text="Start", command=self.toggle_start(self.toggle_animation2, player))
-            btn_start.grid(row=3, column=0, padx=5, pady=5)
+        btn_start = ttk.Button(frame, text="Start", command=lambda: self.start_audio(player))
+        btn_start.grid(row=3, column=0, padx=5, pady=5)
 
-            btn_stop = ttk.Button(frame, text="Stop", command=self.toggle_stop(self.toggle_animation2, player))
-            btn_stop.grid(row=3, column=1, padx=5, pady=5)
+        btn_stop = ttk.Button(frame, text="Stop", command=lambda: self.stop_audio(player))
+        btn_stop.grid(row=3, column=1, padx=5, pady=5)
 
-        btn_sync = ttk.Button(frame, text="Sync Tempo", command=lambda: self.sync_tempo(player, other_player))
-        btn_sync.grid(row=3, column=2, padx=5, pady=5)
+        # Przełącznik: synchronizacja tempa i fazy z drugim deckiem albo jej wyłączenie
+        player.sync_button = ttk.Button(frame, text="Sync Tempo", command=lambda: self.sync_tempo(player, other_player))
+        player.sync_button.grid(row=3, column=2, padx=5, pady=5)
 
         tk.Label(frame, text="Bass").grid(row=4, column=0)
         tk.Scale(frame, from_=-3, to=3, orient="vertical", resolution=0.1,
@@ -80,147 +199,196 @@ class AudioMixerGUI:
         tk.Scale(frame, from_=-3, to=3, orient="vertical", resolution=0.1,
                  command=lambda value: player.set_gain("high", value)).grid(row=5, column=2)
 
-        tk.Label(frame, text="Tempo").grid(row=6, column=0, columnspan=3)
+        tk.Label(frame, text="Tempo").grid(row=6, column=0, columnspan=2)
+        key_lock = tk.BooleanVar(value=player.key_lock)
+        tk.Checkbutton(frame, text="Key Lock", variable=key_lock,
+                       command=lambda: player.set_key_lock(key_lock.get())).grid(row=6, column=2)
         player.tempo_scale = tk.Scale(frame, from_=0.5, to=2, orient="horizontal", length=200,
                                       resolution=0.01,
-                                      label=f"Adjusted BPM: {round(player.tempo * player.tempo_factor, 2)}" if player.tempo != "N/A" else "BPM: N/A",
+                                      label=self.tempo_label(player),
                                       command=lambda value: self.tempo_scale_method(value, player))
         player.tempo_scale.set(1)
         player.tempo_scale.grid(row=7, column=0, columnspan=3)
-        print(player.tempo * player.tempo_factor)
         setattr(self, f"{player.name}_tempo_scale", player.tempo_scale)
 
         btn_mix = ttk.Button(frame, text="Mix Track", command=lambda: player.dynamic_mix(other_player))
         btn_mix.grid(row=8, column=0, columnspan=3, pady=10)
 
         btn_load = ttk.Button(frame, text="Load Track", command=lambda: self.load_track(player))
-        btn_load.grid(row=9, column=0, columnspan=3, pady=5)
-
-        tk.Label(frame, text="Pliki w folderze 'utils':").grid(row=10, column=0, columnspan=3)
+        btn_load.grid(row=9, column=0, columnspan=2, pady=5)
+        # Ranking utworów pasujących do drugiego decku: tonacja (Camelot), BPM i energia
+        harmonic = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Pasujące", variable=harmonic,
+                       state="normal" if self.library is not None else "disabled").grid(row=9, column=2)
+
+        search = tk.StringVar()
+        bpm_match = tk.BooleanVar(value=False)
+        tk.Entry(frame, textvariable=search, width=20).grid(row=10, column=0, columnspan=2, sticky="we")
+        tk.Checkbutton(frame, text="BPM ±6%", variable=bpm_match,
+                       state="normal" if self.library is not None else "disabled").grid(row=10, column=2)
         listbox = tk.Listbox(frame, height=6, width=40)
         listbox.grid(row=11, column=0, columnspan=3, pady=5)
         listbox.bind("<<ListboxSelect>>", lambda event: self.on_select(event, player))
+        self.listboxes[listbox] = (player, other_player, search, bpm_match, harmonic, [])
+        for variable in (search, bpm_match, harmonic):
+            variable.trace_add("write", lambda *args: self.fill_file_list(listbox))
 
         self.fill_file_list(listbox)
 
-    def draw_waveform(self, canvas, data, start_time, window_duration, width, height):
-        canvas.delete("all")
-
-        times = np.array(data["times"])
-        amplitude = np.array(data["amplitude"])
-        beat_times = data["beat_times"]
-
-        amplitude = amplitude / np.max(np.abs(amplitude))
-
-        end_time = start_time + window_duration
-        mask = (times >= start_time) & (times <= end_time)
-        visible_times = times[mask]
-        visible_amplitudes = amplitude[mask]
-
-        if len(visible_times) == 0:
-            return
-
-        red_line_x = width / 2  # Czerwona linia
-        x_coords = np.interp(visible_times, (start_time, end_time), (red_line_x, width + red_line_x))
-        y_coords = np.interp(visible_amplitudes, (-1, 1), (height / 2, 0))
-        y_coords_neg = np.interp(visible_amplitudes, (-1, 1), (height / 2, height))
-
-        for i in range(1, len(x_coords)):
-            canvas.create_line(x_coords[i - 1], y_coords[i - 1], x_coords[i], y_coords[i], fill="cyan", width=2)
-            canvas.create_line(x_coords[i - 1], y_coords_neg[i - 1], x_coords[i], y_coords_neg[i], fill="cyan", width=2)
-
-        left_coords = x_coords - red_line_x
-        for i in range(1, len(left_coords)):
-            if left_coords[i - 1] >= 0 and left_coords[i] >= 0:
-                canvas.create_line(left_coords[i - 1], y_coords[i - 1], left_coords[i], y_coords[i], fill="cyan",
-                                   width=2)
-                canvas.create_line(left_coords[i - 1], y_coords_neg[i - 1], left_coords[i], y_coords_neg[i],
-                                   fill="cyan", width=2)
-
-        canvas.create_line(red_line_x, 0, red_line_x, height, fill="red", width=2)
-
-        for beat in beat_times:
-            if start_time <= beat <= end_time:
-                x = np.interp(beat, (start_time, end_time), (red_line_x, width + red_line_x))
-                canvas.create_line(x, 0, x, height, fill="green", width=1, dash=(4, 4))
-
-        for beat in beat_times:
-            if start_time - window_duration <= beat < start_time:
-                x = np.interp(beat, (start_time - window_duration, start_time), (-red_line_x, red_line_x))
-                if 0 <= x <= red_line_x:
-                    canvas.create_line(x, 0, x, height, fill="green", width=1, dash=(4, 4))
-
-    def animate(self, canvas, data, window_duration, width, height, step, interval):
-        start_time = 0
-        running = [False]
-
-        self.draw_waveform(canvas, data, start_time, window_duration, width, height)
-
-        def update():
-            nonlocal start_time
-            if running[0]:
-                self.draw_waveform(canvas, data, start_time, window_duration, width, height)
-                start_time += step
-                canvas.after(interval, update)
-
-        def toggle_running():
-            running[0] = not running[0]
-            if running[0]:
-                print("Animacja uruchomiona")
-                update()
-            else:
-                print("Animacja zatrzymana")
-
-        return toggle_running
-
-    def toggle_start(self, toggle_animation, player):
-        def toggle():
-            self.start_audio(player)
-            toggle_animation()
+        # Hot cue (klik: skok na beacie albo ustawienie, prawy klik: usunięcie) i pętle na siatce beatów
+        transport = tk.Frame(frame)
+        transport.grid(row=12, column=0, columnspan=3, pady=5)
+        for number in range(1, 5):
+            button = ttk.Button(transport, text=f"Cue {number}", width=6,
+                                command=lambda number=number: self.hot_cue(player, number))
+            button.grid(row=0, column=number - 1, padx=2)
+            button.bind("<Button-3>", lambda event, number=number: player.clear_hot_cue(number))
+        loop_beats = tk.StringVar(value="4")
+        tk.OptionMenu(transport, loop_beats, *("1/4", "1/2", "1", "2", "4", "8", "16", "32")).grid(row=1, column=0)
+        ttk.Button(transport, text="Loop", width=6,
+                   command=lambda: self.set_loop(player, loop_beats.get())).grid(row=1, column=1, padx=2)
+        ttk.Button(transport, text="½", width=3, command=lambda: player.resize_loop(0.5)).grid(row=1, column=2)
+        ttk.Button(transport, text="×2", width=3, command=lambda: player.resize_loop(2)).grid(row=1, column=3)
+        ttk.Button(transport, text="Exit", width=6, command=player.exit_loop).grid(row=1, column=4, padx=2)
+
+    def hot_cue(self, player, number):
+        if not player.jump_to_hot_cue(number):
+            seconds = player.set_hot_cue(number)
+            print(f"Cue {number} ({player.name}): {seconds:.2f} s")
+
+    def set_loop(self, player, beats):
+        numerator, _, denominator = beats.partition("/")
+        value = int(numerator) / int(denominator) if denominator else int(numerator)
+        player.set_loop(value)
 
-        return toggle
-
-    def toggle_stop(self, toggle_animation, player):
-        def toggle():
-            self.stop_audio(player)
-            toggle_animation()
-
-        return toggle
+    def draw_waveform(self, canvas, data, start_time, window_duration, width, height):
+        view = self.waveform_views.get(canvas)
+        if view is None:
+            view = self.waveform_views[canvas] = WaveformView(canvas, width, height)
+        view.draw(data, start_time, window_duration)
+
+    def zoom(self, direction):
+        # Kółko myszy zmienia szerokość okna; piramida przebiegu dobiera poziom szczegółów
+        factor = 1.25 if direction > 0 else 0.8
+        self.window_duration = min(max(self.window_duration * factor, self.min_window), self.max_window)
+
+    def refresh_waveforms(self):
+        # Klatka animacji: pozycję podaje głowica silnika audio, a nie własny licznik GUI.
+        # WaveformView pomija rysowanie, gdy pozycja i dane się nie zmieniły
+        started = time.perf_counter()
+        for canvas, player in ((self.canvas1, self.player1), (self.canvas2, self.player2)):
+            start_time = player.playhead.position() / player.samplerate if player.samplerate else 0
+            self.draw_waveform(canvas, player.analysis, start_time, self.window_duration, self.canvas_width,
+                               self.canvas_height)
+        playing = self.player1.playing or self.player2.playing
+        if playing:
+            self.gui_meter.record_time(time.perf_counter() - started, self.frame_interval / 1000)
+        self.root.after(self.frame_interval if playing else self.idle_interval, self.refresh_waveforms)
+
+    def tempo_label(self, player):
+        bpm = player.bpm()
+        return f"Adjusted BPM: {bpm:.2f}" if bpm else "BPM: N/A"
+
+    def update_tempo_label(self, player):
+        player.tempo_scale.config(label=self.tempo_label(player))
+
+    def update_sync_buttons(self):
+        for player in (self.player1, self.player2):
+            player.sync_button.config(text="Unsync" if player.sync_master is not None else "Sync Tempo")
 
     def tempo_scale_method(self, value, player):
+        # Suwak ustawiony programowo na bieżący (zaokrąglony) mnożnik nie może nadpisać dokładnej wartości
+        if round(player.tempo_factor, 2) == float(value):
+            return
         player.change_tempo_factor(value)
-        player.tempo_scale.config(
-            label=f"Adjusted BPM: {round(player.tempo * player.tempo_factor, 2)}" if player.tempo != "N/A" else "BPM: N/A")
+        self.update_tempo_label(player)
+        # Lista drugiego decku filtrowana po BPM tego decku
+        for listbox, (_, other_player, _, bpm_match, harmonic, _) in self.listboxes.items():
+            if other_player is player and (bpm_match.get() or harmonic.get()):
+                self.fill_file_list(listbox)
 
     def on_select(self, event, player):
         listbox = event.widget
         selected_index = listbox.curselection()
-        if selected_index:
-            if player.name == 'player1':
-                self.toggle_animation = self.animate(self.canvas1, load_json_data(player.json_path),
-                                                     self.window_duration,
-                                                     self.canvas_width, self.canvas_height, 0.05, 50)
-            else:
-                self.toggle_animation2 = self.animate(self.canvas2, load_json_data(player.json_path),
-                                                      self.window_duration,
-                                                      self.canvas_width, self.canvas_height, 0.05, 50)
-            selected_item = listbox.get(selected_index[0])
-            print(f"Wybrano: {selected_item}")
-            player.load_track('utils/' + selected_item)
+        paths = self.listboxes[listbox][5]
+        if selected_index and selected_index[0] < len(paths):
+            index = selected_index[0]
+            file_path = paths[index]
+            print(f"Wybrano: {file_path}")
+            if self.preload is None:
+                player.load_track(file_path, analyze=self.analysis_worker is None)
+                self.track_loaded(player)
+                return
+            # Dekodowanie w tle (razem z sąsiadami na liście); utwór już w cache trafia na deck od razu
+            neighbors = paths[max(index - self.preload_neighbors, 0):index + self.preload_neighbors + 1]
+            future = self.preload.request(file_path, neighbors)
+            track = self.preload.get(file_path)
+            if track is not None:
+                self.pending_loads.pop(player, None)
+                player.load_preloaded(track)
+                self.track_loaded(player)
+                return
+            self.pending_loads[player] = (file_path, future)
+            self.poll_preload(player)
+
+    def poll_preload(self, player):
+        file_path, future = self.pending_loads.get(player, (None, None))
+        if future is None:
+            return
+        if not future.done():
+            self.root.after(self.frame_interval, lambda: self.poll_preload(player))
+            return
+        del self.pending_loads[player]
+        track = None if future.cancelled() or future.exception() else future.result()
+        if track is not None:
+            player.load_preloaded(track)
+        else:
+            # Utwór za długi na cache albo błąd dekodowania: zwykłe ładowanie (strumieniowe dla długich)
+            player.load_track(file_path, analyze=self.analysis_worker is None)
+        self.track_loaded(player)
+
+    def track_loaded(self, player):
+        if (player.analysis is None or needs_reanalysis(player.analysis)) and self.analysis_worker is not None:
+            self.analysis_worker.submit(player.file_path, PRIORITY_DECK)
+        if player.file_path is not None:
             player.track_label.config(text=Path(player.file_path).stem)
-            player.tempo_scale.config(
-                label=f"Adjusted BPM: {round(player.tempo * player.tempo_factor, 2)}" if player.tempo != "N/A" else "BPM: N/A")
+            self.update_tempo_label(player)
             player.tempo_scale.set(1)
-            print("player1 zmieniony")
+        self.update_sync_buttons()
+        for other_listbox, (_, other_player, _, bpm_match, harmonic, _) in self.listboxes.items():
+            if other_player is player and (bpm_match.get() or harmonic.get()):
+                self.fill_file_list(other_listbox)
+        print("player1 zmieniony")
 
     def fill_file_list(self, listbox):
-        folder_path = "./utils"
-        if os.path.exists(folder_path):
-            files = os.listdir(folder_path)
-            for file in files:
-                listbox.insert(tk.END, file)
+        player, other_player, search, bpm_match, harmonic, paths = self.listboxes[listbox]
+        text = search.get().strip()
+        paths.clear()
+        names = []
+        if self.library is not None:
+            # Zapytanie do indeksu zamiast listowania katalogu; BPM porównywane z drugim deckiem po zmianie tempa
+            other_bpm = other_player.tempo * other_player.tempo_factor if other_player.tempo != "N/A" else None
+            if harmonic.get():
+                rows = [row[:5] for row in self.library.compatible(other_bpm, other_player.key, other_player.energy,
+                                                                   exclude=other_player.file_path)
+                        if text.lower() in row[1].lower()]
+            else:
+                rows = self.library.query(bpm=other_bpm if bpm_match.get() else None, text=text)
+            for path, name, track_bpm, key, duration in rows:
+                paths.append(path)
+                label = f"{name}  [{track_bpm:.1f}" if track_bpm else f"{name}  [-"
+                names.append(f"{label} {key}]" if key else f"{label}]")
         else:
-            listbox.insert(tk.END, "Brak folderu 'utils'")
+            if not self.track_paths and os.path.exists("utils"):
+                for file_path in find_audio_files("utils", recursive=False):
+                    self.track_paths.setdefault(os.path.basename(file_path), file_path)
+            for name, file_path in self.track_paths.items():
+                if text.lower() in name.lower():
+                    paths.append(file_path)
+                    names.append(name)
+        listbox.delete(0, tk.END)
+        if names:
+            listbox.insert(tk.END, *names)
 
     def start_audio(self, player):
         player.start()
@@ -231,27 +399,29 @@ class AudioMixerGUI:
         print(f"Stop odtwarzania: {player.name}")
 
     def sync_tempo(self, player, other_player):
-        player.sync_to(other_player)
-        player.tempo_scale.config(
-            label=f"Adjusted BPM: {round(player.tempo * player.tempo_factor, 2)}" if player.tempo != "N/A" else "BPM: N/A")
-        player.tempo_scale.set(round(other_player.tempo * other_player.tempo_factor / player.tempo, 2))
-        print(f"Synchronizacja tempa: {player.name}")
+        if player.sync_master is not None:
+            player.unsync()
+            print(f"Wyłączono synchronizację: {player.name}")
+        else:
+            player.sync_to(other_player)
+            print(f"Synchronizacja tempa: {player.name}")
+        self.update_tempo_label(player)
+        player.tempo_scale.set(round(player.tempo_factor, 2))
+        self.update_sync_buttons()
 
     def load_track(self, player):
         choice = messagebox.askquestion("Wybór", "Chcesz wybrać plik (Yes) czy folder (No)?")
         if choice == 'yes':
             file_path = filedialog.askopenfilename(
-                filetypes=[("WAV files", "*.wav"), ("MP3 files", "*.mp3"), ("All files", "*.*")]
+                filetypes=[("Audio files", "*.wav *.flac *.ogg *.mp3 *.aif *.aiff"), ("All files", "*.*")]
             )
             if file_path:
                 print(f"Wybrano plik: {file_path}")
-
-                convert_mp3_to_wav(file_path)
+                if is_audio_file(file_path):
+                    # Plik jest odtwarzany i analizowany bezpośrednio, bez konwersji do WAV
+                    self.add_track(file_path, PRIORITY_DECK)
         else:
             folder_path = filedialog.askdirectory()
             if folder_path:
                 print(f"Wybrano folder: {folder_path}")
-                for root, dirs, files in os.walk(folder_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        convert_mp3_to_wav(file_path)
+                self.import_folder(folder_path)
@@ -0,0 +1,81 @@
+import numpy as np
+
+PITCHES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+
+# Profile Krumhansla-Kesslera dla tonacji C-dur i c-moll
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Numer w kole Camelot dla tonacji durowych (B) i molowych (A), indeksowane tonem podstawowym od C
+CAMELOT_MAJOR = (8, 3, 10, 5, 12, 7, 2, 9, 4, 11, 6, 1)
+CAMELOT_MINOR = (5, 12, 7, 2, 9, 4, 11, 6, 1, 8, 3, 10)
+
+
+def _key_templates():
+    # 24 znormalizowane szablony (12 dur, 12 moll) jako macierz, żeby dopasowanie było jednym iloczynem
+    templates = []
+    for profile in (MAJOR_PROFILE, MINOR_PROFILE):
+        for tonic in range(12):
+            rotated = np.roll(profile, tonic)
+            rotated = rotated - rotated.mean()
+            templates.append(rotated / np.linalg.norm(rotated))
+    return np.array(templates)
+
+
+KEY_TEMPLATES = _key_templates()
+
+
+def detect_key(chroma):
+    # chroma: (12, klatki) albo uśredniony wektor (12,); zwraca (Camelot, nazwa, pewność)
+    profile = np.asarray(chroma, dtype='float64')
+    if profile.ndim == 2:
+        profile = profile.mean(axis=1)
+    profile = profile - profile.mean()
+    norm = np.linalg.norm(profile)
+    if norm == 0:
+        return None, None, 0.0
+    scores = KEY_TEMPLATES @ (profile / norm)
+    best = int(np.argmax(scores))
+    tonic = best % 12
+    if best < 12:
+        return f"{CAMELOT_MAJOR[tonic]}B", f"{PITCHES[tonic]} major", float(scores[best])
+    return f"{CAMELOT_MINOR[tonic]}A", f"{PITCHES[tonic]} minor", float(scores[best])
+
+
+def parse_camelot(key):
+    if not key:
+        return None
+    try:
+        return int(key[:-1]), key[-1].upper()
+    except ValueError:
+        return None
+
+
+def compatible_keys(key):
+    # Tonacje do miksu harmonicznego z wagą: ta sama, +-1 w kole, równoległa (A<->B), +2 ("energy boost")
+    parsed = parse_camelot(key)
+    if parsed is None:
+        return {}
+    number, letter = parsed
+    other = 'B' if letter == 'A' else 'A'
+    step = lambda offset: (number - 1 + offset) % 12 + 1
+    return {
+        f"{number}{letter}": 1.0,
+        f"{step(1)}{letter}": 0.9,
+        f"{step(-1)}{letter}": 0.9,
+        f"{number}{other}": 0.8,
+        f"{step(2)}{letter}": 0.5,
+    }
+
+
+def energy_profile(mono, samplerate, segment=2.0):
+    # Głośność RMS w dBFS na odcinki po segment sekund oraz jedna liczba energii utworu
+    # (75. percentyl odcinków, żeby ciche intro i outro nie zaniżały wyniku)
+    size = max(int(segment * samplerate), 1)
+    usable = len(mono) // size * size
+    if usable == 0:
+        return np.zeros(0, dtype='float32'), None
+    blocks = np.asarray(mono[:usable], dtype='float32').reshape(-1, size)
+    rms = np.sqrt(np.einsum('ij,ij->i', blocks, blocks) / size)
+    profile = (20 * np.log10(np.maximum(rms, 1e-6))).astype('float32')
+    return profile, float(np.percentile(profile, 75))
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from harmony import compatible_keys
+from sources import is_audio_file
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT,
+    bpm REAL,
+    key TEXT,
+    energy REAL,
+    duration REAL,
+    analyzed_mtime INTEGER,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_bpm ON tracks (bpm);
+CREATE INDEX IF NOT EXISTS tracks_name ON tracks (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_folder ON tracks (folder);
+CREATE INDEX IF NOT EXISTS tracks_hash ON tracks (hash);
+CREATE INDEX IF NOT EXISTS tracks_key_bpm ON tracks (key, bpm);
+'''
+
+HASH_CHUNK = 1 << 16
+# Tonacja utworu przeanalizowanego, dla którego detect_key nie dał wyniku
+NO_KEY = ''
+
+
+def content_hash(path, size=None):
+    # Szybki odcisk treści: rozmiar + początek i koniec pliku. Wystarcza do rozpoznania
+    # przeniesionego lub przemianowanego pliku bez czytania całej biblioteki
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            f.seek(-HASH_CHUNK, os.SEEK_END)
+            digest.update(f.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def walk_audio_files(folder_path, recursive=True):
+    # os.scandir zwraca stat razem z wpisem katalogu, więc skan nie robi osobnego stat na plik
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    stack.append(entry.path)
+            elif is_audio_file(entry.name):
+                stat = entry.stat()
+                yield os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns
+
+
+class TrackLibrary:
+    # Indeks biblioteki w SQLite (WAL): czytanie z wątku GUI nie czeka na zapis skanu w tle.
+    # Ścieżki są przechowywane jako bezwzględne
+    def __init__(self, db_path='library.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        # Indeksy z wcześniejszych wersji nie miały kolumny energy
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(tracks)")]
+        if columns and 'energy' not in columns:
+            self._db.execute("ALTER TABLE tracks ADD COLUMN energy REAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def scan(self, folder_path, recursive=True):
+        # Przyrostowy skan: hashowane i zapisywane są tylko nowe lub zmienione pliki (rozmiar/mtime).
+        # Zwraca (nowe, zmienione, usunięte) ścieżki
+        folder = os.path.abspath(folder_path)
+        sql = "SELECT path, size, mtime FROM tracks WHERE folder = ?"
+        params = [folder]
+        if recursive:
+            prefix = os.path.join(folder, '')
+            sql += " OR substr(folder, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        with self._lock:
+            known = {path: (size, mtime) for path, size, mtime in self._db.execute(sql, params)}
+        seen = set()
+        added, changed = [], []
+        for path, size, mtime in walk_audio_files(folder, recursive):
+            seen.add(path)
+            previous = known.get(path)
+            if previous is None:
+                added.append((path, size, mtime))
+            elif previous != (size, mtime):
+                changed.append((path, size, mtime))
+        removed = [path for path in known if path not in seen]
+
+        rows_added = [(path, size, mtime, content_hash(path, size)) for path, size, mtime in added]
+        rows_changed = [(path, size, mtime, content_hash(path, size)) for path, size, mtime in changed]
+        now = time.time()
+        with self._lock, self._db:
+            moved = {}
+            if removed:
+                # Plik przeniesiony w obrębie biblioteki zachowuje BPM/tonację po hashu treści
+                for start in range(0, len(removed), 500):
+                    chunk = removed[start:start + 500]
+                    for file_hash, bpm, key, energy, duration in self._db.execute(
+                            f"SELECT hash, bpm, key, energy, duration FROM tracks "
+                            f"WHERE path IN ({','.join('?' * len(chunk))}) AND bpm IS NOT NULL", chunk):
+                        moved[file_hash] = (bpm, key, energy, duration)
+                self._db.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in removed])
+            self._db.executemany(
+                "INSERT INTO tracks (path, folder, name, size, mtime, hash, bpm, key, energy, duration, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(path, os.path.dirname(path), os.path.basename(path), size, mtime, file_hash,
+                  *moved.get(file_hash, (None, None, None, None)), now)
+                 for path, size, mtime, file_hash in rows_added])
+            self._db.executemany(
+                "UPDATE tracks SET size = ?, mtime = ?, hash = ?, bpm = NULL, key = NULL, energy = NULL, duration = NULL, "
+                "analyzed_mtime = NULL WHERE path = ?",
+                [(size, mtime, file_hash, path) for path, size, mtime, file_hash in rows_changed])
+        return [row[0] for row in rows_added], [row[0] for row in rows_changed], removed
+
+    def add(self, file_path):
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO tracks (path, folder, name, size, mtime, hash, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, os.path.dirname(path), os.path.basename(path), stat.st_size, stat.st_mtime_ns,
+                 content_hash(path, stat.st_size), time.time()))
+        return path
+
+    def update_analysis(self, file_path, bpm=None, duration=None, key=None, energy=None, key_checked=False):
+        # key_checked: pełna analiza nie znalazła tonacji (cisza, płaska chroma). Zapisujemy wtedy NO_KEY,
+        # żeby odróżnić taki utwór od nieprzeanalizowanego (NULL), który needs_analysis zwraca ponownie
+        if key is None and key_checked:
+            key = NO_KEY
+        path = os.path.abspath(file_path)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE tracks SET bpm = ?, duration = ?, key = COALESCE(?, key), energy = COALESCE(?, energy), "
+                "analyzed_mtime = mtime WHERE path = ?", (bpm, duration, key, energy, path))
+
+    def needs_analysis(self):
+        with self._lock:
+            return [path for path, in self._db.execute(
+                "SELECT path FROM tracks WHERE analyzed_mtime IS NULL OR analyzed_mtime != mtime "
+                "OR (key IS NULL AND bpm IS NOT NULL) ORDER BY name")]
+
+    def get(self, file_path):
+        with self._lock:
+            row = self._db.execute("SELECT path, name, bpm, key, duration FROM tracks WHERE path = ?",
+                                   (os.path.abspath(file_path),)).fetchone()
+        return row
+
+    def query(self, bpm=None, tolerance=0.06, text=None, key=None, limit=5000):
+        # Lista (ścieżka, nazwa, bpm, tonacja, długość) posortowana po nazwie; filtr BPM używa indeksu
+        conditions, params = [], []
+        if bpm:
+            conditions.append("bpm BETWEEN ? AND ?")
+            params += [bpm * (1 - tolerance), bpm * (1 + tolerance)]
+        if text:
+            conditions.append("name LIKE ?")
+            params.append(f"%{text}%")
+        if key:
+            conditions.append("key = ?")
+            params.append(key)
+        sql = "SELECT path, name, bpm, key, duration FROM tracks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY name COLLATE NOCASE"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def compatible(self, bpm, key=None, energy=None, tolerance=0.06, exclude=None, limit=50):
+        # Ranking "następnego utworu": tonacje zgodne w kole Camelot i BPM w zakresie (przez indeks key, bpm),
+        # potem wynik łączący wagę tonacji, odległość BPM i różnicę energii. Zwraca wiersze jak query() + wynik
+        if not bpm:
+            return []
+        keys = compatible_keys(key)
+        sql = "SELECT path, name, bpm, key, duration, energy FROM tracks WHERE bpm BETWEEN ? AND ?"
+        params = [bpm * (1 - tolerance), bpm * (1 + tolerance)]
+        if keys:
+            sql += f" AND key IN ({','.join('?' * len(keys))})"
+            params += list(keys)
+        if exclude:
+            sql += " AND path != ?"
+            params.append(os.path.abspath(exclude))
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        ranked = []
+        for path, name, track_bpm, track_key, duration, track_energy in rows:
+            score = keys.get(track_key, 0.5) - 0.5 * abs(track_bpm - bpm) / (bpm * tolerance)
+            if energy is not None and track_energy is not None:
+                score -= 0.03 * abs(track_energy - energy)
+            ranked.append((score, path, name, track_bpm, track_key, duration))
+        ranked.sort(key=lambda row: row[0], reverse=True)
+        return [(path, name, track_bpm, track_key, duration, score)
+                for score, path, name, track_bpm, track_key, duration in ranked[:limit]]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
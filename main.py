@@ -1,23 +1,43 @@
 from tkinter import Tk
 
-import track_manager
+from analysis_cache import needs_reanalysis
 from gui import AudioMixerGUI
 from audio_player import AudioPlayer as ap
+from background import AnalysisWorker, PRIORITY_DECK
+from library import TrackLibrary
+from mixer import Mixer
+from preload import PreloadCache
 from track_manager import *
 
 
 def main():
     root = Tk()
 
-    track_manager.prepare_music_files()
+    analysis_worker = AnalysisWorker()
+    library = TrackLibrary('library.db')
+    # Budżet RAM na zdekodowane utwory z listy (ok. 25 min stereo 44.1 kHz na 512 MB)
+    preload = PreloadCache(max_bytes=512 << 20)
     player1 = ap("player1")
     player2 = ap("player2")
-    player1.load_track(file_path="utils/123.wav")
-    player2.load_track(file_path="utils/123.wav")
+    mixer = Mixer(blocksize=256, latency='low')
+    mixer.add_deck(player1, side='A')
+    mixer.add_deck(player2, side='B')
+    player1.load_track(file_path="utils/123.wav", analyze=False)
+    player2.load_track(file_path="utils/123.wav", analyze=False)
     player1.change_tempo(1.5)
+    # Utwory na deckach idą do analizy przed resztą biblioteki
+    for player in (player1, player2):
+        if player.analysis is None or needs_reanalysis(player.analysis):
+            analysis_worker.submit(player.file_path, PRIORITY_DECK)
 
-    app = AudioMixerGUI(root, player1, player2)
+    # GUI skanuje 'utils' przyrostowo w tle i zleca analizę tylko nowych lub zmienionych plików
+    app = AudioMixerGUI(root, player1, player2, analysis_worker, library, preload)
+    mixer.start()
     root.mainloop()
+    mixer.stop()
+    analysis_worker.stop()
+    preload.close()
+    library.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,454 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+try:
+    import sounddevice as sd
+except OSError:
+    # Brak biblioteki PortAudio (np. serwer CI): działa tylko render offline
+    sd = None
+
+from dsp import EQBank, Limiter
+from engine import FILL_EDGES, LATENCY_EDGES_MS, Meter, RingBuffer
+
+CROSSFADER_CURVES = ('linear', 'power', 'cut')
+
+
+def crossfader_gains(position, curve='power'):
+    # position: 0 = tylko strona A, 1 = tylko strona B
+    position = min(max(float(position), 0.0), 1.0)
+    if curve == 'linear':
+        return 1.0 - position, position
+    if curve == 'power':
+        return float(np.cos(position * np.pi / 2)), float(np.sin(position * np.pi / 2))
+    if curve == 'cut':
+        return min(1.0, (1.0 - position) * 16), min(1.0, position * 16)
+    raise ValueError(f"Nieznana krzywa crossfadera: {curve}")
+
+
+class Transition:
+    # Przejście equal-power między dwoma deckami szyny, zaplanowane na zegarze próbek miksera.
+    # Krzywe liczone są blok po bloku do wcześniej zaalokowanych buforów
+    def __init__(self, outgoing, incoming, start_clock, length):
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.start_clock = int(start_clock)
+        self.length = max(int(length), 1)
+        self.end_clock = self.start_clock + self.length
+        self.done = False
+
+    def apply(self, clock, out_gains, in_gains, ramp, phase, curve):
+        # Mnoży wzmocnienia obu decków dla bloku zaczynającego się na clock; zwraca True, gdy przejście się skończyło
+        frames = len(out_gains)
+        if clock + frames <= self.start_clock:
+            in_gains.fill(0)
+            return False
+        if clock >= self.end_clock:
+            out_gains.fill(0)
+            self.done = True
+            return True
+        np.add(ramp[:frames], clock - self.start_clock, out=phase[:frames])
+        np.clip(phase[:frames], 0, self.length, out=phase[:frames])
+        phase[:frames] *= np.pi / 2 / self.length
+        np.cos(phase[:frames], out=curve[:frames])
+        out_gains *= curve[:frames]
+        np.sin(phase[:frames], out=curve[:frames])
+        in_gains *= curve[:frames]
+        return False
+
+
+class MixerChannel:
+    def __init__(self, player, ring, side, gain, render_blocksize):
+        self.player = player
+        self.ring = ring
+        self.side = side
+        self.gain = gain
+        self.finished = False
+        self.primed = False
+        self.underruns = 0
+        # Czas render_block względem budżetu i zapełnienie bufora przed odczytem w callbacku
+        self.render_meter = Meter(limit=1.0)
+        self.fill_meter = Meter(FILL_EDGES)
+        # Ramka zegara miksera, od której kanał zacznie czytać bufor (start co do próbki)
+        self.start_clock = None
+        # (zegar, pozycja źródła, ramki źródła na ramkę wyjścia, indeks w buforze) dla początku ostatniego bloku
+        self.anchor = (0, 0.0, 0.0, 0)
+        self.scratch = np.zeros((render_blocksize, ring.channels), dtype='float32')
+        self.positions = np.zeros(render_blocksize, dtype='float64')
+        self.render_time = 0.0
+
+
+class Mixer:
+    # Jedna szyna sumująca: jeden strumień wyjściowy, wspólny zegar próbek dla wszystkich decków.
+    # Callback tylko czyta bufory pierścieniowe decków i sumuje je z wzmocnieniami;
+    # DSP decków liczy wątek producenta (z pulą wątków przy wielu rdzeniach) z wyprzedzeniem.
+    def __init__(self, samplerate=44100, channels=2, blocksize=256, latency='low', buffer_frames=4096,
+                 render_blocksize=1024, max_decks=4, curve='power', ceiling=0.98, workers=None):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.latency = latency
+        self.buffer_frames = buffer_frames
+        self.render_blocksize = render_blocksize
+        self.max_decks = max_decks
+        # Wątki DSP decków (łącznie z wątkiem producenta); domyślnie tyle, ile rdzeni, najwyżej jeden na deck
+        self.workers = workers if workers is not None else min(max_decks, os.cpu_count() or 1)
+        self.eq_bank = EQBank()
+        self._pool = None
+        self.curve = curve
+        self.crossfader = 0.5
+        self.master_gain = 1.0
+        self.limiter = Limiter(ceiling)
+        self.decks = []
+        self.transitions = []
+        self.clock = 0
+        self.callbacks = 0
+        self.device_xruns = 0
+        self.callback_meter = Meter(limit=1.0)
+        self.latency_meter = Meter(LATENCY_EDGES_MS)
+        self._gains = np.zeros((max_decks, buffer_frames), dtype='float32')
+        self._ramp = np.arange(buffer_frames, dtype='float64')
+        self._phase = np.zeros(buffer_frames, dtype='float64')
+        self._curve = np.zeros(buffer_frames, dtype='float64')
+        self._stack = np.zeros((max_decks, buffer_frames, channels), dtype='float32')
+        self._stream = None
+        self._thread = None
+        self._running = threading.Event()
+
+    def add_deck(self, player, side=None, gain=1.0):
+        if len(self.decks) >= self.max_decks:
+            raise ValueError(f"Mikser obsługuje maksymalnie {self.max_decks} decki")
+        ring = RingBuffer(self.buffer_frames, self.channels)
+        channel = MixerChannel(player, ring, side, gain, self.render_blocksize)
+        self.decks.append(channel)
+        player.mixer = self
+        player.output_samplerate = self.samplerate
+        return channel
+
+    def running(self):
+        # Prawda, gdy działa wątek producenta (granie na żywo)
+        return self._running.is_set()
+
+    def channel(self, player):
+        for channel in self.decks:
+            if channel.player is player:
+                return channel
+        raise ValueError(f"Deck {player.name} nie jest podłączony do miksera")
+
+    def set_gain(self, player, gain):
+        self.channel(player).gain = float(gain)
+
+    def set_crossfader(self, position):
+        self.crossfader = min(max(float(position), 0.0), 1.0)
+
+    def set_curve(self, curve):
+        if curve not in CROSSFADER_CURVES:
+            raise ValueError(f"Nieznana krzywa crossfadera: {curve}")
+        self.curve = curve
+
+    def schedule_transition(self, outgoing, incoming, start_clock, length):
+        # Deck wchodzący czeka w ciszy do start_clock z wypełnionym buforem
+        transition = Transition(self.channel(outgoing), self.channel(incoming), start_clock, length)
+        transition.incoming.start_clock = transition.start_clock
+        # Callback tylko czyta listę; podmieniamy ją w całości
+        self.transitions = [t for t in self.transitions if not t.done] + [transition]
+        return transition
+
+    def deck_gain(self, channel):
+        gain = channel.gain * self.master_gain
+        if channel.side is not None:
+            side_a, side_b = crossfader_gains(self.crossfader, self.curve)
+            gain *= side_a if channel.side == 'A' else side_b
+        return gain
+
+    def stats(self):
+        return {
+            'clock': self.clock,
+            'callbacks': self.callbacks,
+            'device_xruns': self.device_xruns,
+            'callback_load': self.callback_meter.snapshot(),
+            'latency_ms': self.latency_meter.snapshot(),
+            'decks': {channel.player.name: {'underruns': channel.underruns,
+                                            'buffered_frames': channel.ring.available(),
+                                            'render_load': channel.render_meter.snapshot(),
+                                            'stretch_load': channel.player.stretch_meter.snapshot(),
+                                            'eq_load': channel.player.eq_meter.snapshot(),
+                                            'fill': channel.fill_meter.snapshot()}
+                      for channel in self.decks},
+        }
+
+    def summary(self):
+        # Jedna linia do GUI lub logu: obciążenie callbacku, najcięższy deck, błędy
+        deck = max(self.decks, key=lambda channel: channel.render_meter.last, default=None)
+        text = (f"Callback {self.callback_meter.last:.0%} (max {self.callback_meter.peak:.0%}), "
+                f"xrun {self.device_xruns}, opóźn. {self.latency_meter.last:.1f} ms")
+        if deck is not None:
+            text += (f" | DSP {deck.player.name} {deck.render_meter.last:.0%} "
+                     f"(tempo {deck.player.stretch_meter.last:.0%}, EQ {deck.player.eq_meter.last:.0%})")
+        underruns = sum(channel.underruns for channel in self.decks)
+        return text + f", niedobory {underruns}"
+
+    def dump_stats(self, path, extra=None):
+        with open(path, 'w') as f:
+            json.dump(dict(self.stats(), timestamp=time.time(), **(extra or {})), f, indent=2)
+        print(f"Zapisano statystyki do {path}")
+
+    def reset_stats(self):
+        self.device_xruns = 0
+        self.callback_meter.reset()
+        self.latency_meter.reset()
+        for channel in self.decks:
+            channel.underruns = 0
+            channel.render_meter.reset()
+            channel.fill_meter.reset()
+            channel.player.stretch_meter.reset()
+            channel.player.eq_meter.reset()
+
+    def mix_into(self, outdata, latency=0.0):
+        frames = len(outdata)
+        now = time.monotonic()
+        count = len(self.decks)
+        for i, channel in enumerate(self.decks):
+            self._gains[i, :frames] = self.deck_gain(channel)
+            buffer = self._stack[i, :frames]
+            player = channel.player
+            if not player.playing:
+                buffer.fill(0)
+                player.playhead.update(player.current_index, 0, timestamp=now)
+                continue
+            offset = 0
+            if channel.start_clock is not None:
+                offset = min(max(channel.start_clock - self.clock, 0), frames)
+                if offset == frames:
+                    buffer.fill(0)
+                    player.playhead.update(player.current_index, 0, timestamp=now)
+                    continue
+                buffer[:offset] = 0
+                channel.start_clock = None
+            channel.fill_meter.record(channel.ring.available() / channel.ring.capacity)
+            read = channel.ring.read_into(buffer[offset:])
+            if offset + read < frames:
+                buffer[offset + read:] = 0
+                if channel.finished:
+                    if channel.ring.available() == 0:
+                        player.playing = False
+                elif channel.primed:
+                    channel.underruns += 1
+            if read:
+                ring = channel.ring
+                player.current_index = int(ring.last_position)
+                step = ring.first_step
+                channel.anchor = (self.clock + offset, ring.first_position, step, ring.read_index - read)
+                player.playhead.update(ring.first_position, step * self.samplerate,
+                                       latency + offset / self.samplerate, now)
+        for transition in self.transitions:
+            if transition.done:
+                continue
+            out_gains = self._gains[self.decks.index(transition.outgoing), :frames]
+            in_gains = self._gains[self.decks.index(transition.incoming), :frames]
+            if transition.apply(self.clock, out_gains, in_gains, self._ramp, self._phase, self._curve):
+                transition.outgoing.player.playing = False
+                if transition.incoming.player.sync_master is transition.outgoing.player:
+                    transition.incoming.player.unsync()
+        # Jedna zwektoryzowana suma wszystkich decków z ich wzmocnieniami (per ramka)
+        np.einsum('df,dfc->fc', self._gains[:count, :frames], self._stack[:count, :frames], out=outdata)
+        self.limiter.process(outdata, self.samplerate)
+        self.clock += frames
+
+    def _callback(self, outdata, frames, time_info, status):
+        started = time.perf_counter()
+        self.callbacks += 1
+        if status.output_underflow:
+            self.device_xruns += 1
+        latency = time_info.outputBufferDacTime - time_info.currentTime if time_info is not None else 0.0
+        self.mix_into(outdata, max(latency, 0.0))
+        self.latency_meter.record(max(latency, 0.0) * 1000)
+        self.callback_meter.record_time(time.perf_counter() - started, frames / self.samplerate)
+
+    def phase_correction(self, channel, horizon=0.25, limit=0.02):
+        # Pętla fazowa decku zsynchronizowanego: porównuje pozycję w siatce beatów decku i jego mastera
+        # w chwili (zegar miksera), w której zabrzmi następna renderowana ramka, i zwraca mnożnik tempa,
+        # który zniweluje błąd w ciągu horizon sekund; ograniczony do +-limit, żeby nie było słychać zmiany wysokości
+        player = channel.player
+        master = player.sync_master
+        if not master.playing or not player.beat_grid.period or not master.beat_grid.period:
+            return 1.0
+        try:
+            leader = self.channel(master)
+        except ValueError:
+            return 1.0
+        if channel.start_clock is not None or channel.ring.flushing() or leader.ring.flushing():
+            return player.phase_correction
+        clock, _, _, index = channel.anchor
+        leader_clock, leader_position, leader_step, _ = leader.anchor
+        if leader_step == 0:
+            return player.phase_correction
+        write_clock = clock + channel.ring.write_index - index
+        leader_seconds = (leader_position + (write_clock - leader_clock) * leader_step) / master.samplerate
+        seconds = player.stretcher.position / player.samplerate
+        error = float(player.beat_grid.position(seconds) - master.beat_grid.position(leader_seconds))
+        error = (error + 0.5) % 1.0 - 0.5
+        period = player.beat_grid.period
+        player.phase_error = error * period / player.tempo_factor
+        rate = player.tempo_factor * player.samplerate / self.samplerate
+        correction = 1.0 - error * period * player.samplerate / (horizon * self.samplerate * rate)
+        return min(max(correction, 1.0 - limit), 1.0 + limit)
+
+    def render_ahead(self):
+        # Jeden przebieg producenta; zwraca True, jeśli cokolwiek wyrenderowano.
+        # Zmiana tempa decków idzie równolegle w puli wątków (workers > 1), EQ wszystkich decków
+        # jednym EQBank; obie części to głównie kod NumPy/SciPy bez GIL, więc skalują się na rdzenie
+        # Błąd w DSP jednego decku zatrzymuje tylko ten deck; pozostałe grają dalej
+        ready = []
+        for channel in self.decks:
+            player = channel.player
+            try:
+                # Polecenia także dla zatrzymanych decków: ładowanie utworu czeka na ten wątek
+                if player.apply_commands():
+                    channel.primed = False
+                    channel.ring.flush()
+                    channel.finished = False
+                if not player.playing:
+                    continue
+                if channel.finished or channel.ring.free() < self.render_blocksize:
+                    continue
+                if channel.scratch.shape[1] != player.audio_data.shape[1]:
+                    channel.scratch = np.zeros((self.render_blocksize, player.audio_data.shape[1]), dtype='float32')
+                if player.sync_master is not None:
+                    player.follow_master()
+                    player.phase_correction = self.phase_correction(channel)
+            except Exception as e:
+                self._deck_failed(channel, e)
+                continue
+            ready.append(channel)
+        if not ready:
+            return False
+
+        if self.workers > 1 and len(ready) > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers - 1, thread_name_prefix='deck-dsp')
+            # Pierwszy deck liczy bieżący wątek, pozostałe pula
+            futures = [self._pool.submit(self._stretch, channel) for channel in ready[1:]]
+            frames = [self._stretch(ready[0])] + [future.result() for future in futures]
+        else:
+            frames = [self._stretch(channel) for channel in ready]
+
+        rendered = []
+        for channel, count in zip(ready, frames):
+            if count:
+                rendered.append((channel, count))
+            elif count == 0:
+                channel.finished = True
+        if not rendered:
+            return False
+        started = time.perf_counter()
+        try:
+            self.eq_bank.process([channel.player.eq for channel, _ in rendered],
+                                 [channel.scratch[:count] for channel, count in rendered])
+        except Exception:
+            # Wspólne wywołanie nie mówi, który deck zawiódł: powtarzamy EQ osobno dla każdego.
+            # Bloki mogły zostać częściowo nadpisane, ale to tylko jeden blok przy awarii
+            rendered = [(channel, count) for channel, count in rendered
+                        if self._equalize(channel, count)]
+        # Czas wspólnego EQ rozkładamy po równo na decki
+        eq_time = (time.perf_counter() - started) / max(len(rendered), 1)
+        for channel, count in rendered:
+            budget = count / self.samplerate
+            channel.player.eq_meter.record_time(eq_time, budget)
+            channel.render_meter.record_time(channel.render_time + eq_time, budget)
+            channel.ring.write(channel.scratch[:count], positions=channel.positions)
+            channel.primed = True
+        return bool(rendered)
+
+    def _stretch(self, channel):
+        # Liczba ramek albo None, gdy deck zgłosił błąd (i został zatrzymany)
+        started = time.perf_counter()
+        try:
+            frames = channel.player.render_block(channel.scratch, channel.positions, equalize=False)
+        except Exception as e:
+            self._deck_failed(channel, e)
+            return None
+        channel.render_time = time.perf_counter() - started
+        return frames
+
+    def _equalize(self, channel, count):
+        try:
+            channel.player.eq.process(channel.scratch[:count], out=channel.scratch[:count])
+        except Exception as e:
+            self._deck_failed(channel, e)
+            return False
+        return True
+
+    def _deck_failed(self, channel, error):
+        player = channel.player
+        print(f"Błąd DSP decku {player.name}: {error!r} - deck zatrzymany")
+        player.playing = False
+        channel.primed = False
+        channel.ring.flush()
+
+    def _produce(self):
+        idle = self.render_blocksize / self.samplerate / 4
+        while self._running.is_set():
+            try:
+                produced = self.render_ahead()
+            except Exception as e:
+                # Ostatnia linia obrony: wątek producenta nie może zginąć po cichu
+                print(f"Błąd wątku renderującego miksera: {e!r}")
+                produced = False
+            if not produced:
+                time.sleep(idle)
+
+    def render_to_file(self, path, duration=None, blocksize=None, subtype=None, on_block=None):
+        # Render bez urządzenia audio: ten sam łańcuch decków, bufory pierścieniowe i szyna co na żywo,
+        # tylko tak szybko, jak pozwala CPU. Plik (WAV/FLAC wg rozszerzenia) zapisywany jest blok po bloku.
+        # Bez duration render trwa, dopóki gra którykolwiek deck; on_block(mixer) wołane przed każdym blokiem.
+        if self._stream is not None:
+            raise RuntimeError("Mikser gra na żywo; zatrzymaj go przed renderem offline")
+        blocksize = min(blocksize or self.render_blocksize, self.buffer_frames - self.render_blocksize)
+        total = None if duration is None else int(duration * self.samplerate)
+        block = np.zeros((blocksize, self.channels), dtype='float32')
+        written = 0
+        with sf.SoundFile(path, 'w', samplerate=self.samplerate, channels=self.channels, subtype=subtype) as f:
+            while total is None or written < total:
+                if on_block is not None:
+                    on_block(self)
+                if total is None and not any(channel.player.playing for channel in self.decks):
+                    break
+                frames = blocksize if total is None else min(blocksize, total - written)
+                while self.render_ahead():
+                    pass
+                self.mix_into(block[:frames])
+                f.write(block[:frames])
+                written += frames
+        return written
+
+    def start(self):
+        if self._stream is not None:
+            return
+        if sd is None:
+            raise RuntimeError("Brak PortAudio - odtwarzanie na żywo niedostępne, użyj render_to_file")
+        self._running.set()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+        self._stream = sd.OutputStream(samplerate=self.samplerate, channels=self.channels,
+                                       blocksize=self.blocksize, latency=self.latency, dtype='float32',
+                                       callback=self._callback)
+        self._stream.start()
+        print("Mikser uruchomiony")
+
+    def stop(self):
+        if self._stream is None:
+            return
+        self._stream.stop()
+        self._stream.close()
+        self._stream = None
+        self._running.clear()
+        self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        print("Mikser zatrzymany")
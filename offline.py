@@ -0,0 +1,63 @@
+import argparse
+import time
+
+from audio_player import AudioPlayer
+from mixer import Mixer
+
+
+def render_set(tracks, output_path, play_time=60.0, fade_duration=16.0, samplerate=44100, subtype=None,
+               duration=None):
+    # Nagranie seta bez karty dźwiękowej: kolejne utwory wchodzą na zmianę na deck A i B,
+    # a przejście (dynamic_mix) startuje po play_time sekundach grania bieżącego utworu
+    mixer = Mixer(samplerate=samplerate)
+    decks = [AudioPlayer("A"), AudioPlayer("B")]
+    mixer.add_deck(decks[0], 'A')
+    mixer.add_deck(decks[1], 'B')
+    mixer.set_crossfader(0.5)
+
+    queue = list(tracks)
+    decks[0].load_track(queue.pop(0))
+    decks[0].start()
+    state = {'current': 0, 'next_mix': int(play_time * samplerate)}
+
+    def on_block(mixer):
+        if not queue or mixer.clock < state['next_mix']:
+            return
+        current = decks[state['current']]
+        incoming = decks[1 - state['current']]
+        if incoming.playing:
+            return
+        incoming.load_track(queue.pop(0))
+        current.dynamic_mix(incoming, fade_duration)
+        if not incoming.playing:
+            # Bez siatki beatów nie da się zaplanować przejścia; następny utwór wchodzi od razu
+            incoming.start()
+            current.pause()
+        state['current'] = 1 - state['current']
+        state['next_mix'] = mixer.clock + int(play_time * samplerate)
+
+    started = time.perf_counter()
+    frames = mixer.render_to_file(output_path, duration, subtype=subtype, on_block=on_block)
+    elapsed = time.perf_counter() - started
+    seconds = frames / samplerate
+    print(f"Zapisano {output_path}: {seconds:.1f} s audio w {elapsed:.1f} s "
+          f"({seconds / elapsed if elapsed else 0:.1f}x czasu rzeczywistego)")
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render miksu do pliku WAV/FLAC bez urządzenia audio.")
+    parser.add_argument('output', help="plik wynikowy (.wav lub .flac)")
+    parser.add_argument('tracks', nargs='+', help="utwory w kolejności odtwarzania")
+    parser.add_argument('--play', type=float, default=60.0, help="sekundy grania utworu przed przejściem")
+    parser.add_argument('--fade', type=float, default=16.0, help="długość przejścia w sekundach")
+    parser.add_argument('--samplerate', type=int, default=44100)
+    parser.add_argument('--subtype', default=None, help="np. PCM_16, PCM_24, FLOAT")
+    parser.add_argument('--duration', type=float, default=None, help="maksymalna długość nagrania w sekundach")
+    args = parser.parse_args()
+
+    render_set(args.tracks, args.output, args.play, args.fade, args.samplerate, args.subtype, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+from sources import PCM_EXTENSIONS
+from track_manager import get_analysis
+
+
+class PreloadedTrack:
+    # Zdekodowany utwór gotowy do podpięcia pod deck: PCM (float32, ramki x kanały) i analiza z cache
+    def __init__(self, file_path, audio_data, samplerate, analysis, signature=None):
+        self.file_path = file_path
+        # (rozmiar, mtime) pliku w chwili dekodowania; zmiana na dysku unieważnia wpis
+        self.signature = signature
+        self.audio_data = audio_data
+        self.samplerate = samplerate
+        self.analysis = analysis
+
+    @property
+    def nbytes(self):
+        return self.audio_data.nbytes
+
+
+class PreloadCache:
+    # Dekodowanie w tle zaznaczonego utworu i jego sąsiadów na liście do LRU buforów PCM w RAM,
+    # ograniczonego max_bytes. Deck dostaje gotowe tablice (AudioPlayer.load_preloaded), bez dekodowania
+    # ani analizy w wątku GUI. Tablice, które gra deck, żyją dalej po usunięciu z cache
+    def __init__(self, max_bytes=1 << 30, workers=1, pcm_cache=None, max_seconds=600, target_dir='waveforms'):
+        self.max_bytes = max_bytes
+        self.pcm_cache = pcm_cache
+        # Dłuższe utwory deck i tak czyta strumieniowo z dysku (stream_threshold), więc ich nie trzymamy
+        self.max_seconds = max_seconds
+        self.target_dir = target_dir
+        self._tracks = OrderedDict()
+        self._pending = {}
+        # Ścieżki zamówione dla decku (nie jako sąsiedzi); tych zleceń nie anulujemy
+        self._primary = set()
+        self._bytes = 0
+        # RLock: Future.cancel i add_done_callback na gotowym zleceniu wołają _finished synchronicznie
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def get(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            track = self._tracks.get(file_path)
+            if track is None:
+                return None
+            if track.signature != (stat.st_size, stat.st_mtime_ns):
+                del self._tracks[file_path]
+                self._bytes -= track.nbytes
+                return None
+            self._tracks.move_to_end(file_path)
+            return track
+
+    def request(self, file_path, neighbors=()):
+        # Zwraca Future z PreloadedTrack (None, gdy utwór się nie kwalifikuje) dla file_path i zleca sąsiadów.
+        # Niezaczęte zlecenia, które wypadły z nowego zestawu (szybkie przewijanie listy), są anulowane
+        wanted = [file_path] + [path for path in neighbors if path != file_path]
+        with self._lock:
+            for path, future in list(self._pending.items()):
+                if path not in wanted and path not in self._primary:
+                    # Anulowanie od razu woła _finished, który usuwa wpis (dlatego blokada jest RLock)
+                    future.cancel()
+            futures = []
+            for path in wanted:
+                future = self._pending.get(path)
+                if future is None:
+                    future = self._pool.submit(self._load, path)
+                    self._pending[path] = future
+                    future.add_done_callback(lambda done, path=path: self._finished(path, done))
+                futures.append(future)
+            # Chronione jest tylko zlecenie, które wciąż czeka; _finished zdejmuje ochronę po jego zakończeniu
+            if self._pending.get(file_path) is futures[0]:
+                self._primary.add(file_path)
+        return futures[0]
+
+    def _finished(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+                self._primary.discard(path)
+
+    def _load(self, file_path):
+        track = self.get(file_path)
+        if track is not None:
+            return track
+        stat = os.stat(file_path)
+        playable = file_path
+        if self.pcm_cache is not None and not file_path.lower().endswith(PCM_EXTENSIONS):
+            playable = self.pcm_cache.get(file_path)
+        info = sf.info(playable)
+        size = info.frames * info.channels * 4
+        if info.duration > self.max_seconds or size > self.max_bytes:
+            return None
+        audio_data, samplerate = sf.read(playable, dtype='float32', always_2d=True)
+        track = PreloadedTrack(file_path, audio_data, samplerate,
+                               get_analysis(file_path, target_dir=self.target_dir, compute=False),
+                               (stat.st_size, stat.st_mtime_ns))
+        self._store(track)
+        return track
+
+    def _store(self, track):
+        with self._lock:
+            previous = self._tracks.pop(track.file_path, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._tracks[track.file_path] = track
+            self._bytes += track.nbytes
+            while self._bytes > self.max_bytes and len(self._tracks) > 1:
+                _, evicted = self._tracks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def invalidate(self, file_path):
+        # Po zmianie pliku na dysku albo nowej analizie
+        with self._lock:
+            track = self._tracks.pop(file_path, None)
+            if track is not None:
+                self._bytes -= track.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {'tracks': len(self._tracks), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'pending': len(self._pending)}
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+
+class StreamingSource:
+    # Źródło audio czytane z dysku blokami przez soundfile.SoundFile. Zachowuje się jak tablica
+    # (frames, channels): len(), shape, dtype i wycinki source[a:b]. W pamięci trzyma tylko
+    # kilka bloków wokół bieżącej pozycji; wątek w tle czyta z wyprzedzeniem.
+    def __init__(self, path, block_frames=1 << 16, ahead_blocks=4, behind_blocks=2):
+        self.path = path
+        self._file = sf.SoundFile(path)
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+        self.shape = (self.frames, self.channels)
+        self.ndim = 2
+        self.dtype = np.dtype('float32')
+        self.block_frames = block_frames
+        self.ahead_blocks = ahead_blocks
+        self.behind_blocks = behind_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._wanted = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("StreamingSource obsługuje tylko ciągłe wycinki [start:stop]")
+        start, stop, _ = key.indices(self.frames)
+        out = np.empty((max(stop - start, 0), self.channels), dtype='float32')
+        position = start
+        while position < stop:
+            index = position // self.block_frames
+            block = self._block(index)
+            offset = position - index * self.block_frames
+            take = min(stop - position, len(block) - offset)
+            if take <= 0:
+                out = out[:position - start]
+                break
+            out[position - start:position - start + take] = block[offset:offset + take]
+            position += take
+        if self._wanted != stop // self.block_frames:
+            self._wanted = stop // self.block_frames
+            self._wake.set()
+        return out
+
+    def _block(self, index):
+        with self._lock:
+            block = self._blocks.get(index)
+            if block is not None:
+                self._blocks.move_to_end(index)
+                return block
+        # Chybienie (np. po przeskoku): czytamy synchronicznie tylko ten jeden blok
+        block = self._read_block(index)
+        self._store(index, block)
+        return block
+
+    def _read_block(self, index):
+        with self._file_lock:
+            self._file.seek(index * self.block_frames)
+            return self._file.read(self.block_frames, dtype='float32', always_2d=True)
+
+    def _store(self, index, block):
+        with self._lock:
+            self._blocks[index] = block
+            self._blocks.move_to_end(index)
+            # Limit pamięci: bloki daleko za pozycją lub ponad pojemność są usuwane
+            capacity = self.ahead_blocks + self.behind_blocks + 1
+            for old in [i for i in self._blocks if i < self._wanted - self.behind_blocks]:
+                del self._blocks[old]
+            while len(self._blocks) > capacity:
+                self._blocks.popitem(last=False)
+
+    def _read_ahead(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            last = (self.frames - 1) // self.block_frames
+            for index in range(self._wanted, min(self._wanted + self.ahead_blocks, last + 1)):
+                if self._closed or self._wake.is_set():
+                    break
+                with self._lock:
+                    cached = index in self._blocks
+                if not cached:
+                    self._store(index, self._read_block(index))
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        with self._file_lock:
+            self._file.close()
+
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.aif', '.aiff')
+PCM_EXTENSIONS = ('.wav', '.aif', '.aiff')
+
+
+def is_audio_file(path):
+    return path.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def find_audio_files(folder_path, recursive=True):
+    if not recursive:
+        return [os.path.join(folder_path, file) for file in sorted(os.listdir(folder_path)) if is_audio_file(file)]
+    return [os.path.join(root, file) for root, _, files in os.walk(folder_path)
+            for file in sorted(files) if is_audio_file(file)]
+
+
+def can_decode(path):
+    try:
+        sf.info(path)
+        return True
+    except Exception:
+        return False
+
+
+class PcmCache:
+    # Opcjonalny cache zdekodowanego PCM dla plików skompresowanych (MP3/FLAC/OGG), ograniczony
+    # rozmiarem; przy przepełnieniu usuwane są najdawniej używane wpisy (LRU po mtime)
+    def __init__(self, cache_dir='pcm_cache', max_bytes=4 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, source_path):
+        stat = os.stat(source_path)
+        key = f"{os.path.abspath(source_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{Path(source_path).stem}-{digest}.wav")
+
+    def get(self, source_path):
+        cache_path = self.path_for(source_path)
+        if os.path.exists(cache_path):
+            os.utime(cache_path)
+            return cache_path
+        # Unikalny plik tymczasowy na każdego piszącego (jak save_analysis): równoległe get() tego samego
+        # utworu nie piszą do jednego pliku, a os.replace podmienia gotowy WAV atomowo
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=Path(cache_path).stem + '-', suffix='.tmp')
+        os.close(fd)
+        try:
+            decode_to_pcm(source_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=cache_path)
+        return cache_path
+
+    def evict(self, keep=None):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith('.wav') and path != keep:
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            if keep is not None and os.path.exists(keep):
+                total += os.path.getsize(keep)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+
+
+def decode_to_pcm(source_path, target_path, block_frames=1 << 16):
+    # Dekodowanie strumieniowe przez libsndfile; pydub (ffmpeg) tylko dla formatów, których libsndfile nie czyta
+    if can_decode(source_path):
+        with sf.SoundFile(source_path) as source, \
+                sf.SoundFile(target_path, 'w', samplerate=source.samplerate, channels=source.channels,
+                             subtype='FLOAT', format='WAV') as target:
+            for block in source.blocks(blocksize=block_frames, dtype='float32', always_2d=True):
+                target.write(block)
+        return
+
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(source_path)
+    samples = np.array(audio.get_array_of_samples(), dtype='float32').reshape(-1, audio.channels)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+    sf.write(target_path, samples, audio.frame_rate, subtype='FLOAT', format='WAV')
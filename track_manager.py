@@ -1,69 +1,158 @@
-from pydub import AudioSegment
+import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import librosa
 import numpy as np
-import json
 
+import soundfile as sf
 
-def convert_mp3_to_wav(input_path: str, output_dir: str = 'utils/'):
-    if not os.path.isfile(input_path):
-        raise FileNotFoundError(f"Plik nie istnieje: {input_path}")
+from analysis_cache import PeakPyramidBuilder, TrackAnalysis, cache_path_for, legacy_json_path, load_analysis, \
+    load_valid_analysis, migrate_json, needs_reanalysis, save_analysis, source_signature
+from harmony import detect_key, energy_profile
+from library import TrackLibrary
+from sources import find_audio_files
 
-    if not input_path.lower().endswith(".mp3"):
-        raise ValueError("Plik wejściowy musi być w formacie MP3")
 
-    output_path = output_dir + Path(input_path).stem + ".wav"
+def prepare_music_files(source_dir='utils', target_dir='waveforms', workers=None):
+    missing_files = []
 
-    try:
-        audio = AudioSegment.from_mp3(input_path)
-        audio.export(output_path, format="wav")
-        print(f"Plik zostal skonwertowany: {output_path}")
-        return output_path
+    for file_path in find_audio_files(source_dir, recursive=False):
+        analysis = load_valid_analysis(file_path, target_dir)
+        if analysis is None:
+            # Stary JSON przenosimy od razu (przebieg dostępny bez czekania), ale bez tonacji i energii,
+            # więc i tak trafia do pełnej analizy
+            json_filepath = legacy_json_path(file_path, target_dir)
+            if os.path.exists(json_filepath):
+                migrate_json(json_filepath, file_path, target_dir)
+            missing_files.append(file_path)
+        elif needs_reanalysis(analysis):
+            missing_files.append(file_path)
 
-    except Exception as e:
-        raise RuntimeError(f"Wystąpił blad podczas konwersji: {e}")
+    if missing_files:
+        print(f"Brakujące dane analizy dla {len(missing_files)} plików")
+        analyze_library(missing_files, target_dir, workers)
+    else:
+        print("Wszystkie pliki audio mają aktualne dane analizy.")
 
 
-def prepare_music_files(source_dir='utils', target_dir='waveforms'):
-    missing_files = []
+def print_progress(done, total, file_path, elapsed, error=None):
+    eta = elapsed / done * (total - done) if done else 0
+    status = f"BŁĄD: {error}" if error else "ok"
+    print(f"[{done}/{total}] {done / total:.0%} {os.path.basename(file_path)} {status} "
+          f"(upłynęło {elapsed:.0f} s, pozostało ~{eta:.0f} s)", flush=True)
 
-    for file in os.listdir(source_dir):
-        if file.endswith(".wav"):
-            json_filename = os.path.splitext(file)[0] + ".json"
-            json_filepath = os.path.join(target_dir, json_filename)
-            if not os.path.exists(json_filepath):
-                missing_files.append((file, json_filepath))
 
-    if missing_files:
-        print("Brakujące pliki .json dla:")
-        for file, json_filepath in missing_files:
-            precompute_waveform_and_save_it_to_file(os.path.join(source_dir, file), json_filepath)
-            print(f"Stworzono waveform dla {file}")
-    else:
-        print("Wszystkie pliki .wav mają odpowiadające pliki .json.")
+def analyze_file(file_path, target_dir='waveforms'):
+    # Uruchamiane w procesie roboczym; wynik trafia na dysk atomowo przez save_analysis
+    return get_analysis(file_path, target_dir=target_dir).bpm
+
+
+def analyze_library(files, target_dir='waveforms', workers=None, progress=print_progress):
+    # Analiza wsadowa w puli procesów; pliki z aktualną analizą są pomijane,
+    # więc przerwane przebiegi można po prostu wznowić
+    os.makedirs(target_dir, exist_ok=True)
+    pending = []
+    for file in files:
+        analysis = load_valid_analysis(file, target_dir)
+        if analysis is None or needs_reanalysis(analysis):
+            pending.append(file)
+    total = len(pending)
+    failed = []
+    if not total:
+        return failed
+
+    started = time.monotonic()
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    try:
+        futures = {executor.submit(analyze_file, file, target_dir): file for file in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            error = future.exception()
+            if error is not None:
+                failed.append((file_path, error))
+            if progress is not None:
+                progress(done, total, file_path, time.monotonic() - started, error)
+    except KeyboardInterrupt:
+        print("Przerwano analizę; gotowe wyniki zostały zapisane, kolejne uruchomienie wznowi pracę.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return failed
 
 
-def precompute_waveform_and_save_it_to_file(file, json_filepath):
-    audio_data, sr = librosa.load(file, sr=None)
-    duration = librosa.get_duration(y=audio_data, sr=sr)
+def analyze_audio(audio_data, sr):
+    # audio_data: sygnał mono; z tego samego zdekodowanego sygnału liczymy BPM, siatkę beatów,
+    # piramidę przebiegu, tonację (chroma) i profil energii
+    duration = len(audio_data) / sr
     tempo, beats = librosa.beat.beat_track(y=audio_data, sr=sr)
     beat_times = librosa.frames_to_time(beats, sr=sr)
-    num_points = 10000  # Number of points for the entire waveform
-    downsampled_audio = librosa.resample(audio_data, orig_sr=sr, target_sr=num_points / duration)
-    times = np.linspace(0, duration, num=len(downsampled_audio))
-    amplitude = downsampled_audio / np.max(np.abs(audio_data))  # Normalize amplitude
-    waveform_data = {
-        "times": times.tolist(),
-        "amplitude": amplitude.tolist(),
-        "beat_times": beat_times.tolist()
-    }
-    with open(json_filepath, "w") as f:
-        json.dump(waveform_data, f)
-    print(f"Precomputed waveform data saved to {json_filepath}.")
-
-
-def load_json_data(filepath):
-    with open(filepath, 'r') as f:
-        data = json.load(f)
-    return data
+    pyramid = PeakPyramidBuilder(sr)
+    for start in range(0, len(audio_data), 1 << 16):
+        pyramid.add(audio_data[start:start + (1 << 16)])
+    chroma = librosa.feature.chroma_stft(y=audio_data, sr=sr, n_fft=8192, hop_length=4096)
+    key, key_name, _ = detect_key(chroma)
+    profile, energy = energy_profile(audio_data, sr)
+    return TrackAnalysis(duration, pyramid.finish(), beat_times, float(np.atleast_1d(tempo)[0]),
+                         {'key_name': key_name}, key, energy, profile)
+
+
+def precompute_waveform_and_save_it_to_file(file, target_dir='waveforms', audio_data=None, sr=None):
+    if audio_data is None:
+        # libsndfile dekoduje WAV/FLAC/OGG/MP3 bezpośrednio, bez pośredniej kopii WAV
+        audio_data, sr = sf.read(file, dtype='float32', always_2d=True)
+    analysis = analyze_audio(audio_data.mean(axis=1), sr)
+    analysis.meta['source'] = source_signature(file)
+    cache_path = cache_path_for(file, target_dir)
+    save_analysis(cache_path, analysis)
+    print(f"Precomputed waveform data saved to {cache_path}.")
+    return load_analysis(cache_path)
+
+
+def get_analysis(file_path, audio_data=None, sr=None, target_dir='waveforms', compute=True):
+    # Analiza z cache (klucz: ścieżka, rozmiar, mtime); liczona tylko przy braku lub zmianie pliku.
+    # Z compute=False zwraca None zamiast liczyć analizę, a wpis przeniesiony ze starego formatu
+    # (bez tonacji i energii) bez liczenia go od nowa
+    analysis = load_valid_analysis(file_path, target_dir)
+    json_filepath = legacy_json_path(file_path, target_dir)
+    if analysis is None and os.path.exists(json_filepath):
+        analysis = migrate_json(json_filepath, file_path, target_dir)
+    if analysis is not None and (not compute or not needs_reanalysis(analysis)):
+        return analysis
+    if not compute:
+        return None
+    return precompute_waveform_and_save_it_to_file(file_path, target_dir, audio_data, sr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wsadowa analiza biblioteki utworów (BPM, beaty, waveform).")
+    parser.add_argument('source_dir', nargs='?', default='utils', help="katalog z plikami audio (WAV/FLAC/OGG/MP3)")
+    parser.add_argument('--target-dir', default='waveforms', help="katalog cache analizy")
+    parser.add_argument('--workers', type=int, default=None, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument('--library', default=None, help="indeks biblioteki SQLite; analizowane są tylko nowe i zmienione pliki")
+    args = parser.parse_args()
+
+    library = None
+    if args.library:
+        library = TrackLibrary(args.library)
+        added, changed, removed = library.scan(args.source_dir)
+        print(f"Skan: nowe {len(added)}, zmienione {len(changed)}, usunięte {len(removed)}")
+        files = library.needs_analysis()
+    else:
+        files = find_audio_files(args.source_dir)
+    failed = analyze_library(files, args.target_dir, args.workers)
+    if library is not None:
+        for file_path in files:
+            analysis = load_valid_analysis(file_path, args.target_dir)
+            if analysis is not None:
+                library.update_analysis(file_path, analysis.bpm, analysis.duration, analysis.key, analysis.energy,
+                                        key_checked=not needs_reanalysis(analysis))
+        library.close()
+    for file_path, error in failed:
+        print(f"Nie udało się przeanalizować {file_path}: {error}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class WaveformView:
+    # Renderer przebiegu dla jednego Canvas: elementy Tk tworzone są raz,
+    # a w każdej klatce zmieniamy tylko ich współrzędne przez canvas.coords
+    def __init__(self, canvas, width, height, color="cyan", rms_color="steelblue", beat_color="green",
+                 cue_color="red"):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.beat_color = beat_color
+        # Obwiednia min/max i RMS jako dwa wielokąty zamiast tysięcy odcinków
+        self.envelope = canvas.create_polygon(0, height / 2, width, height / 2, fill=color, outline=color)
+        self.rms = canvas.create_polygon(0, height / 2, width, height / 2, fill=rms_color, outline=rms_color)
+        self.beat_items = []
+        self.visible_beats = 0
+        self.cue = canvas.create_line(width / 2, 0, width / 2, height, fill=cue_color, width=2)
+        self._last = None
+        self._coords = np.empty(0)
+
+    def draw(self, data, start_time, window_duration):
+        # start_time: pozycja czerwonej linii; okno obejmuje window_duration / 2 przed i po niej
+        state = (id(data), start_time, window_duration)
+        if state == self._last:
+            return
+        self._last = state
+
+        if data is None:
+            self._hide_waveform()
+            self._place_beats(np.empty(0))
+            return
+
+        t0 = start_time - window_duration / 2
+        t1 = start_time + window_duration / 2
+        scale = self.width / window_duration
+        times, mins, maxs, rms = data.window(t0, t1, 1 / scale)
+        if len(times) < 2:
+            self._hide_waveform()
+        else:
+            x = (times - t0) * scale
+            half = self.height / 2
+            self._set_polygon(self.envelope, x, half - maxs * half, half - mins * half)
+            self._set_polygon(self.rms, x, half - rms * half, half + rms * half)
+
+        self._place_beats((data.grid.in_range(t0, t1) - t0) * scale)
+        self.canvas.tag_raise(self.cue)
+
+    def _set_polygon(self, item, x, top, bottom):
+        # Górna krawędź od lewej do prawej, dolna z powrotem
+        points = len(x)
+        if len(self._coords) != 4 * points:
+            self._coords = np.empty(4 * points)
+        self._coords[0:2 * points:2] = x
+        self._coords[1:2 * points:2] = top
+        self._coords[2 * points::2] = x[::-1]
+        self._coords[2 * points + 1::2] = bottom[::-1]
+        self.canvas.coords(item, self._coords.tolist())
+
+    def _hide_waveform(self):
+        half = self.height / 2
+        self.canvas.coords(self.envelope, 0, half, self.width, half)
+        self.canvas.coords(self.rms, 0, half, self.width, half)
+
+    def _place_beats(self, xs):
+        while len(self.beat_items) < len(xs):
+            self.beat_items.append(self.canvas.create_line(0, 0, 0, self.height, fill=self.beat_color, width=1,
+                                                           dash=(4, 4), state="hidden"))
+        for item, x in zip(self.beat_items, xs):
+            self.canvas.coords(item, x, 0, x, self.height)
+        if self.visible_beats != len(xs):
+            for item in self.beat_items[:len(xs)]:
+                self.canvas.itemconfigure(item, state="normal")
+            for item in self.beat_items[len(xs):self.visible_beats]:
+                self.canvas.itemconfigure(item, state="hidden")
+            self.visible_beats = len(xs)